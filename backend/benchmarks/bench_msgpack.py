@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Payload size and encode time for GET /api/tasks as JSON vs MessagePack.
+
+Encodes the same task documents through task_list_serializer.response(), the
+path the tasks endpoint uses, with and without an Accept: application/msgpack
+request in context.
+
+    cd backend && python benchmarks/bench_msgpack.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import server  # noqa: E402
+from bench_serialization import make_task_documents  # noqa: E402
+
+ROUNDS = 10
+
+
+def encode(documents, as_msgpack):
+    token = server.msgpack_requested.set(as_msgpack)
+    try:
+        return server.task_list_serializer.response(documents).body
+    finally:
+        server.msgpack_requested.reset(token)
+
+
+def bench(documents, as_msgpack):
+    body = encode(documents, as_msgpack)  # warm up
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        encode(documents, as_msgpack)
+    return len(body), (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    if server.msgpack is None:
+        sys.exit("msgpack is not installed")
+    print(f"{'tasks':>6} {'format':<8} {'bytes':>10} {'encode ms':>10}")
+    for count in (1000, 10000):
+        documents = make_task_documents(count)
+        json_size, json_time = bench(documents, False)
+        msgpack_size, msgpack_time = bench(documents, True)
+        print(f"{count:>6} {'json':<8} {json_size:>10} {json_time * 1000:>10.2f}")
+        print(f"{count:>6} {'msgpack':<8} {msgpack_size:>10} {msgpack_time * 1000:>10.2f}"
+              f"   ({msgpack_size / json_size:.0%} of JSON size)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for list response serialization.
+
+Compares the original path (Task(**doc) per document, then FastAPI validating and
+encoding the list again through response_model + stdlib JSON) with the two
+ListSerializer modes used by the list endpoints. Reports cost per 1000 tasks.
+
+    cd backend && python benchmarks/bench_serialization.py
+"""
+
+import asyncio
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import server  # noqa: E402
+
+TASKS = 1000
+ROUNDS = 20
+
+
+def make_task_documents(count):
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "id": str(uuid.uuid4()),
+            "title": f"Task {i}",
+            "description": "Investigate the flaky deploy step and write up findings",
+            "project_id": str(uuid.uuid4()),
+            "assigned_to": str(uuid.uuid4()),
+            "due_date": now + timedelta(days=i % 30),
+            "status": ("To Do", "In Progress", "Done")[i % 3],
+            "created_by": str(uuid.uuid4()),
+            "created_at": now,
+            "version": i % 5,
+        }
+        for i in range(count)
+    ]
+
+
+def bench(label, fn):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        body = fn()
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    print(f"{label:<40} {elapsed * 1000:8.2f} ms / {TASKS} tasks   ({len(body)} bytes)")
+    return elapsed
+
+
+def main():
+    documents = make_task_documents(TASKS)
+    response_field = create_response_field(name="response", type_=List[server.Task])
+
+    def original():
+        # What the handlers did before: validate each document, then FastAPI
+        # dumps, re-validates and JSON-encodes the list for response_model.
+        tasks = [server.Task(**document) for document in documents]
+        content = asyncio.run(serialize_response(field=response_field, response_content=tasks))
+        return JSONResponse(content).body
+
+    def validated_once():
+        server.TRUSTED_OUTPUT_SERIALIZATION = False
+        try:
+            return server.task_list_serializer.dump_json(documents)
+        finally:
+            server.TRUSTED_OUTPUT_SERIALIZATION = True
+
+    def trusted():
+        return server.task_list_serializer.dump_json(documents)
+
+    before = bench("validate + response_model + json", original)
+    once = bench("single pydantic-core validate + dump", validated_once)
+    after = bench("trusted projection + orjson", trusted)
+    print(f"speedup: {before / once:.1f}x validated once, {before / after:.1f}x trusted")
+
+
+if __name__ == "__main__":
+    main()
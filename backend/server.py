@@ -1,32 +1,359 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.routing import APIRoute
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+import pymongo
+from pymongo import InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany, ReturnDocument, monitoring
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, TypeAdapter
 from typing import List, Optional
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from contextvars import ContextVar
+import json
+import hashlib
+import time
+import zlib
 import jwt
 from passlib.context import CryptContext
 import bcrypt
+import asyncio
+import contextvars
+import heapq
+import secrets
+import re
+import unicodedata
+import itertools
+import random
+import sys
+import threading
+import traceback
+from bisect import bisect_left
+from collections import OrderedDict
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+    from fastapi.responses import JSONResponse as DefaultResponse
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; without it every response is JSON
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Database command instrumentation
+# Attribute every MongoDB command to the request that issued it (Server-Timing, debug log, /metrics)
+DB_COMMAND_INSTRUMENTATION = os.environ.get('DB_COMMAND_INSTRUMENTATION', 'true').lower() == 'true'
+# Commands slower than this are written to the capped slow_queries collection; 0 disables the slow log
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '100'))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', '0.1'))
+SLOW_QUERY_LOG_SIZE_BYTES = int(os.environ.get('SLOW_QUERY_LOG_SIZE_BYTES', str(16 * 1024 * 1024)))
+# Per-request query budget: "warn" logs violations, "raise" (for test runs) turns them into a 500, "off" skips the check
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'warn').lower()
+QUERY_BUDGET_DEFAULT = int(os.environ.get('QUERY_BUDGET_DEFAULT', '25'))  # DB calls per request
+# Per-route budgets as JSON, e.g. {"POST /api/tasks/bulk": 40}
+QUERY_BUDGET_OVERRIDES = json.loads(os.environ.get('QUERY_BUDGET_OVERRIDES', '{}'))
+QUERY_REPEAT_LIMIT = int(os.environ.get('QUERY_REPEAT_LIMIT', '5'))  # Same query shape per request, the N+1 signature
+
+class RequestDbStats:
+    """MongoDB commands issued while handling one request"""
+    
+    __slots__ = ("scope", "commands", "shapes")
+    
+    def __init__(self, scope=None):
+        self.scope = scope
+        # (collection, command name, seconds, documents returned or affected); list.append is
+        # atomic, so commands finishing on different Motor executor threads need no lock
+        self.commands = []
+        self.shapes = []  # "<command> <collection> <query shape>" per command, for the query budget
+    
+    @property
+    def count(self) -> int:
+        return len(self.commands)
+    
+    @property
+    def seconds(self) -> float:
+        return sum(command[2] for command in self.commands)
+
+# Motor copies the caller's context into its executor threads, so the listener sees this too
+request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+def command_collection(command_name: str, command) -> str:
+    if command_name == "getMore":
+        return command.get("collection", "")
+    target = command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+def reply_document_count(reply) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+# Commands whose explain output describes a query plan
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Command fields that carry the query shape
+QUERY_SHAPE_FIELDS = ("filter", "query", "q", "sort", "projection", "pipeline", "updates", "deletes", "key", "update")
+
+def normalize_query_shape(value):
+    """Replace literal values with "?" so queries differing only in their parameters share one shape"""
+    if isinstance(value, dict):
+        return {key: normalize_query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(item, dict) for item in value):
+            return [normalize_query_shape(item) for item in value]
+        return "?"
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value in (1, -1):
+        return value  # Sort directions and projection flags are part of the shape
+    return "?"
+
+def command_query_shape(command_name: str, command) -> str:
+    shape = {field: normalize_query_shape(command[field]) for field in QUERY_SHAPE_FIELDS if field in command}
+    return json.dumps(shape, default=str)
+
+def explain_summary(explain: dict) -> dict:
+    """Plan type and docs examined vs returned, from explain("executionStats") output"""
+    def find(document, key):
+        if isinstance(document, dict):
+            if key in document:
+                return document[key]
+            children = document.values()
+        elif isinstance(document, list):
+            children = document
+        else:
+            return None
+        for child in children:
+            found = find(child, key)
+            if found is not None:
+                return found
+        return None
+    
+    stages = []
+    plan = find(explain, "winningPlan") or {}
+    plan = plan.get("queryPlan", plan)
+    while plan:
+        stages.append(plan.get("stage", "?"))
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    stats = find(explain, "executionStats") or {}
+    return {
+        "plan": " <- ".join(stages),
+        "collection_scan": "COLLSCAN" in stages,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis")
+    }
+
+class SlowQueryLog:
+    """Records slow commands into the capped slow_queries collection, explaining a sample of them.
+    
+    The command listener runs on Motor's executor threads, so entries are handed to the event loop
+    and written from there, in an empty context so the writes are not attributed to any request.
+    """
+    
+    def __init__(self):
+        self.loop = None
+        self._pending = set()
+    
+    def attach(self, loop):
+        self.loop = loop
+    
+    def record(self, database: str, collection: str, command_name: str, command, seconds: float,
+               documents: int, stats: Optional[RequestDbStats]):
+        if self.loop is None or collection == "slow_queries" or command_name == "explain":
+            return
+        entry = {
+            "at": datetime.utcnow(),
+            "route": route_template(stats.scope) if stats is not None and stats.scope is not None else "background",
+            "collection": collection,
+            "command": command_name,
+            "shape": command_query_shape(command_name, command),
+            "duration_ms": round(seconds * 1000, 3),
+            "docs": documents,
+            "explain": None
+        }
+        explain_command = None
+        if command_name in EXPLAINABLE_COMMANDS and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE_RATE:
+            explain_command = {
+                key: value for key, value in command.items()
+                if not key.startswith("$") and key not in ("lsid", "txnNumber", "autocommit", "startTransaction")
+            }
+        self.loop.call_soon_threadsafe(self._spawn, database, entry, explain_command, context=contextvars.Context())
+    
+    def _spawn(self, database: str, entry: dict, explain_command: Optional[dict]):
+        task = self.loop.create_task(self._write(database, entry, explain_command))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+    
+    async def _write(self, database: str, entry: dict, explain_command: Optional[dict]):
+        if explain_command is not None:
+            try:
+                explain = await client[database].command({"explain": explain_command, "verbosity": "executionStats"})
+                # Sampled time first, so $max over explains picks the latest one
+                entry["explain"] = {"sampled_at": entry["at"], **explain_summary(explain)}
+            except Exception:
+                logger.warning("Failed to explain slow %s on %s", entry["command"], entry["collection"], exc_info=True)
+        try:
+            await db.slow_queries.insert_one(entry)
+        except Exception:
+            logger.exception("Failed to record slow %s on %s", entry["command"], entry["collection"])
+
+slow_query_log = SlowQueryLog()
+
+class DbCommandListener(monitoring.CommandListener):
+    """pymongo listener that records each command against the current request's RequestDbStats
+    and hands commands over SLOW_QUERY_THRESHOLD_MS to the slow query log"""
+    
+    def __init__(self):
+        self._started = {}  # (connection id, request id) -> (database, collection, command) of a started command
+    
+    def started(self, event):
+        if request_db_stats.get() is not None or SLOW_QUERY_THRESHOLD_MS > 0:
+            self._started[(event.connection_id, event.request_id)] = (
+                event.database_name, command_collection(event.command_name, event.command), event.command
+            )
+    
+    def _finish(self, event, documents: int):
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        database, collection, command = started
+        seconds = event.duration_micros / 1e6
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats.commands.append((collection, event.command_name, seconds, documents))
+            if QUERY_BUDGET_MODE != "off" and event.command_name != "getMore":
+                stats.shapes.append(f"{event.command_name} {collection} {command_query_shape(event.command_name, command)}")
+        if 0 < SLOW_QUERY_THRESHOLD_MS <= seconds * 1000:
+            slow_query_log.record(database, collection, event.command_name, command, seconds, documents, stats)
+    
+    def succeeded(self, event):
+        self._finish(event, reply_document_count(event.reply))
+    
+    def failed(self, event):
+        self._finish(event, 0)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url, event_listeners=[DbCommandListener()] if DB_COMMAND_INSTRUMENTATION else []
+)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=DefaultResponse)
+
+# MessagePack content negotiation
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# True while handling a request whose Accept header asks for MessagePack
+msgpack_requested: ContextVar[bool] = ContextVar("msgpack_requested", default=False)
+
+def accepts_msgpack(accept: Optional[str]) -> bool:
+    if not accept or msgpack is None:
+        return False
+    for media_range in accept.split(","):
+        media_type, _, params = media_range.partition(";")
+        if media_type.strip().lower() in MSGPACK_MEDIA_TYPES:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+def msgpack_default(value):
+    # Stored datetimes are naive UTC; aware ones are packed natively as the timestamp extension type
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__} to MessagePack")
+
+def pack_msgpack(content) -> bytes:
+    return msgpack.packb(content, datetime=True, default=msgpack_default, use_bin_type=True)
+
+class MsgPackRequest(Request):
+    """Request whose MessagePack body is presented to FastAPI as already-parsed JSON"""
+    
+    async def json(self):
+        if not hasattr(self, "_json"):
+            self._json = msgpack.unpackb(await self.body(), timestamp=3)
+        return self._json
+
+class NegotiatedRoute(APIRoute):
+    """API route that reads and writes MessagePack when the client asks for it; JSON stays the default"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Used to restore native types (datetimes) when re-encoding a JSON body as MessagePack
+        self.msgpack_adapter = TypeAdapter(self.response_model) if self.response_model else None
+    
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        
+        async def negotiated_handler(request: Request) -> Response:
+            if msgpack is None:
+                return await handler(request)
+            
+            content_type = request.headers.get("content-type", "")
+            if content_type.split(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES:
+                headers = [(k, v) for k, v in request.scope["headers"] if k != b"content-type"]
+                headers.append((b"content-type", b"application/json"))
+                request = MsgPackRequest({**request.scope, "headers": headers}, request.receive)
+            
+            wants_msgpack = accepts_msgpack(request.headers.get("accept"))
+            token = msgpack_requested.set(wants_msgpack)
+            try:
+                response = await handler(request)
+            finally:
+                msgpack_requested.reset(token)
+            
+            if wants_msgpack and response.media_type == "application/json" and hasattr(response, "body"):
+                content = json.loads(response.body) if response.body else None
+                if self.msgpack_adapter is not None and content is not None:
+                    content = self.msgpack_adapter.dump_python(self.msgpack_adapter.validate_python(content))
+                headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+                response = Response(content=pack_msgpack(content), status_code=response.status_code,
+                                    media_type=MSGPACK_MEDIA_TYPES[0], headers=headers)
+            response.headers["Vary"] = "Accept"
+            return response
+        
+        return negotiated_handler
+    
+    async def handle(self, scope, receive, send):
+        metrics = http_metrics.route(scope["method"], self.path)
+        metrics.in_flight += 1
+        try:
+            deadline = REQUEST_DEADLINE_OVERRIDES.get(f"{scope['method']} {self.path}", REQUEST_DEADLINE_SECONDS)
+            if deadline > 0:
+                await run_with_deadline(super().handle, scope, receive, send, deadline, metrics)
+            else:
+                await super().handle(scope, receive, send)
+        finally:
+            metrics.in_flight -= 1
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=NegotiatedRoute)
 
 # Security
 security = HTTPBearer()
@@ -36,6 +363,104 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = "project_management_secret_key_2025"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Trust the user id, name and role signed into the token instead of loading the user on every request
+STATELESS_AUTH = os.environ.get('STATELESS_AUTH', 'false').lower() == 'true'
+TOKEN_REVOCATION_REFRESH_SECONDS = float(os.environ.get('TOKEN_REVOCATION_REFRESH_SECONDS', '5'))
+# Sliding sessions: an idle refresh token expires after REFRESH_TOKEN_EXPIRE_DAYS, a session after REFRESH_SESSION_MAX_DAYS
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', '14'))
+REFRESH_SESSION_MAX_DAYS = int(os.environ.get('REFRESH_SESSION_MAX_DAYS', '90'))
+
+# Bulk Operations Configuration
+BULK_TASK_OPERATIONS_LIMIT = int(os.environ.get('BULK_TASK_OPERATIONS_LIMIT', '100'))
+
+# Notification Configuration
+NOTIFICATION_COALESCE_WINDOW_SECONDS = int(os.environ.get('NOTIFICATION_COALESCE_WINDOW_SECONDS', '600'))
+NOTIFICATION_DIGEST_INTERVAL_SECONDS = int(os.environ.get('NOTIFICATION_DIGEST_INTERVAL_SECONDS', '0'))  # 0 disables digest mode
+
+# Serialization Configuration
+# Build list responses from DB documents without re-validating them
+TRUSTED_OUTPUT_SERIALIZATION = os.environ.get('TRUSTED_OUTPUT_SERIALIZATION', 'true').lower() == 'true'
+
+# Compression Configuration
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))  # Bytes; smaller bodies go out as-is
+COMPRESSION_CONTENT_TYPES = tuple(os.environ.get(
+    'COMPRESSION_CONTENT_TYPES',
+    'application/json,application/msgpack,application/x-msgpack,application/x-ndjson,text/'
+).split(','))  # Prefixes; already-compressed types such as images are never listed
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+ZSTD_LEVEL = int(os.environ.get('ZSTD_LEVEL', '3'))
+
+# Streaming Configuration
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', '500'))  # Documents per cursor batch and per written chunk
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# User Loader Configuration
+USER_LOADER_CACHE_TTL_SECONDS = float(os.environ.get('USER_LOADER_CACHE_TTL_SECONDS', '5'))
+USER_LOADER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_LOADER_CACHE_MAX_ENTRIES', '10000'))
+
+# Access Control Configuration
+PROJECT_ACCESS_CACHE_TTL_SECONDS = int(os.environ.get('PROJECT_ACCESS_CACHE_TTL_SECONDS', '30'))
+PROJECT_ACCESS_CACHE_MAX_ENTRIES = int(os.environ.get('PROJECT_ACCESS_CACHE_MAX_ENTRIES', '50000'))
+# Read accessible projects from the indexed project_memberships collection (always kept in sync with team_members)
+USE_PROJECT_MEMBERSHIPS = os.environ.get('USE_PROJECT_MEMBERSHIPS', 'false').lower() == 'true'
+
+# Metrics Configuration
+# Upper bounds (seconds) of the request latency histogram buckets
+METRICS_LATENCY_BUCKETS = tuple(float(b) for b in os.environ.get(
+    'METRICS_LATENCY_BUCKETS', '0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10'
+).split(","))
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Event Loop Monitor Configuration
+EVENT_LOOP_MONITOR_INTERVAL_SECONDS = float(os.environ.get('EVENT_LOOP_MONITOR_INTERVAL_SECONDS', '0.1'))  # 0 disables the monitor
+EVENT_LOOP_LAG_THRESHOLD_MS = float(os.environ.get('EVENT_LOOP_LAG_THRESHOLD_MS', '250'))  # Stalls longer than this log the loop's stack
+EVENT_LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Admission Control Configuration
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '64'))  # Per worker; 0 disables admission control
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '256'))
+ADMISSION_MAX_QUEUE_WAIT_MS = float(os.environ.get('ADMISSION_MAX_QUEUE_WAIT_MS', '500'))
+ADMISSION_MAX_LOOP_LAG_MS = float(os.environ.get('ADMISSION_MAX_LOOP_LAG_MS', '500'))  # Above this only high priority requests are admitted
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get('ADMISSION_RETRY_AFTER_SECONDS', '1'))
+
+# Request Deadline Configuration
+REQUEST_DEADLINE_SECONDS = float(os.environ.get('REQUEST_DEADLINE_SECONDS', '10'))  # 0 disables deadlines
+# Per-route deadlines as JSON, e.g. {"GET /api/analytics/overview": 20}
+REQUEST_DEADLINE_OVERRIDES = json.loads(os.environ.get('REQUEST_DEADLINE_OVERRIDES', '{}'))
+# Once a streamed response has started, the request deadline stops and each cursor batch gets this instead
+STREAM_BATCH_TIMEOUT_SECONDS = float(os.environ.get('STREAM_BATCH_TIMEOUT_SECONDS', '10'))
+# Time limit for reads shared between requests (single-flight, user loader), which no single request's deadline bounds
+SHARED_READ_TIMEOUT_SECONDS = float(os.environ.get('SHARED_READ_TIMEOUT_SECONDS', '10'))
+
+# Rate Limit Configuration
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# "memory" keeps token buckets per worker; "mongo" shares fixed-window counters across the fleet
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory').lower()
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))  # In-memory buckets kept per limit; the least recently used is evicted beyond this
+# Use the first X-Forwarded-For address as the client IP; only enable behind a proxy that sets it
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() == 'true'
+# "<requests>/<seconds>": bucket size and the time it takes to refill completely
+RATE_LIMITS = {
+    "auth": os.environ.get('RATE_LIMIT_AUTH', '20/60'),  # Per client IP
+    "comments": os.environ.get('RATE_LIMIT_COMMENTS', '30/60'),  # Per user
+    "files": os.environ.get('RATE_LIMIT_FILES', '10/60'),  # Per user
+    "writes": os.environ.get('RATE_LIMIT_WRITES', '120/60'),  # Per user, task and project mutations
+}
+
+# User Search Configuration
+USER_SEARCH_MAX_RESULTS = int(os.environ.get('USER_SEARCH_MAX_RESULTS', '50'))
+
+# Full-Text Search Configuration
+SEARCH_PAGE_SIZE_LIMIT = int(os.environ.get('SEARCH_PAGE_SIZE_LIMIT', '50'))
+SEARCH_MAX_WINDOW = int(os.environ.get('SEARCH_MAX_WINDOW', '500'))  # Deepest hit reachable by paging
+SEARCH_SNIPPET_CHARS = int(os.environ.get('SEARCH_SNIPPET_CHARS', '160'))
+
+# Aggregate wording for notification types that coalesce per task
+COALESCED_NOTIFICATION_MESSAGES = {
+    "comment": "{count} new comments on task: {subject}",
+    "file_upload": "{count} files uploaded to task: {subject}",
+}
 
 # User Models
 class UserCreate(BaseModel):
@@ -55,10 +480,19 @@ class User(BaseModel):
     role: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class UserSummary(BaseModel):
+    id: str
+    name: str
+    email: EmailStr
+
 class Token(BaseModel):
     access_token: str
     token_type: str
     user: User
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 # Project Models
 class ProjectCreate(BaseModel):
@@ -72,11 +506,16 @@ class Project(BaseModel):
     owner_id: str
     team_members: List[str] = Field(default_factory=list)  # List of user IDs who are team members
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0  # Bumped on every update; exposed as the ETag for If-Match
 
 # Project Team Management Models
 class ProjectTeamUpdate(BaseModel):
     team_members: List[str]
 
+class ProjectTeamDiff(BaseModel):
+    add: List[str] = Field(default_factory=list)
+    remove: List[str] = Field(default_factory=list)
+
 # Task Models  
 class TaskCreate(BaseModel):
     title: str
@@ -96,6 +535,35 @@ class Task(BaseModel):
     status: str = "To Do"
     created_by: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0
+
+class TaskWithUsers(Task):
+    assignee: Optional[UserSummary] = None
+    creator: Optional[UserSummary] = None
+
+# Bulk Task Models
+class BulkTaskOperation(BaseModel):
+    op: str  # create, update_status, reassign, delete
+    task_id: Optional[str] = None  # Required for everything except create
+    task: Optional[TaskCreate] = None  # Required for create
+    status: Optional[str] = None  # Required for update_status
+    assigned_to: Optional[str] = None  # For reassign; null unassigns
+
+class BulkTaskRequest(BaseModel):
+    operations: List[BulkTaskOperation]
+
+class BulkTaskResult(BaseModel):
+    index: int
+    op: str
+    task_id: Optional[str] = None
+    success: bool
+    status_code: int
+    detail: Optional[str] = None
+
+class BulkTaskResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkTaskResult]
 
 # Notification Models
 class Notification(BaseModel):
@@ -107,6 +575,7 @@ class Notification(BaseModel):
     task_id: Optional[str] = None
     project_id: Optional[str] = None
     read: bool = False
+    count: int = 1  # Number of events folded into this notification
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class NotificationCreate(BaseModel):
@@ -144,6 +613,7 @@ class Comment(BaseModel):
     parent_id: Optional[str] = None  # For threaded comments
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
+    version: int = 0
 
 class CommentCreate(BaseModel):
     task_id: str
@@ -167,6 +637,105 @@ class ProjectProgress(BaseModel):
     project_title: str
     stats: ProgressStats
 
+# Response serialization
+class ListSerializer:
+    """Precompiled JSON serializer for list responses built from DB documents.
+    
+    Documents we wrote ourselves are trusted: in that mode each one is projected onto the
+    response model's fields and encoded by orjson, with no pydantic models built at all.
+    Otherwise the list is validated once and dumped by pydantic-core. Either way the handler
+    returns a Response, so FastAPI skips its second validation pass against response_model.
+    """
+    
+    def __init__(self, model):
+        self.model = model
+        self.adapter = TypeAdapter(List[model])
+        # (field name, default) pairs; default-factory fields are always present in stored documents
+        self.fields = [(name, field.get_default()) for name, field in model.model_fields.items()]
+        self.datetime_fields = [
+            name for name, field in model.model_fields.items() if field.annotation in (datetime, Optional[datetime])
+        ]
+    
+    def to_python(self, documents: List[dict]) -> List[dict]:
+        if TRUSTED_OUTPUT_SERIALIZATION:
+            fields = self.fields
+            return [{name: document.get(name, default) for name, default in fields} for document in documents]
+        return self.adapter.dump_python(self.adapter.validate_python(documents))
+    
+    def dump_json(self, documents: List[dict]) -> bytes:
+        if TRUSTED_OUTPUT_SERIALIZATION and orjson is not None:
+            return orjson.dumps(self.to_python(documents))
+        return self.adapter.dump_json(self.adapter.validate_python(documents))
+    
+    def dump_json_items(self, documents: List[dict], ndjson: bool) -> bytes:
+        """Encode a batch as comma-joined JSON array items, or as newline-terminated NDJSON lines"""
+        if TRUSTED_OUTPUT_SERIALIZATION and orjson is not None:
+            rows = self.to_python(documents)
+            if ndjson:
+                return b"".join(orjson.dumps(row) + b"\n" for row in rows)
+            return orjson.dumps(rows)[1:-1]
+        models = self.adapter.validate_python(documents)
+        if ndjson:
+            return b"".join(model.model_dump_json().encode() + b"\n" for model in models)
+        return self.adapter.dump_json(models)[1:-1]
+    
+    def stream(self, cursor, ndjson: bool = False, headers: Optional[dict] = None, prepare=None) -> StreamingResponse:
+        """Write the cursor's documents out batch by batch, so memory stays flat whatever the result size.
+        
+        prepare, if given, is awaited with each batch and returns the documents to encode.
+        """
+        cursor.batch_size(STREAM_BATCH_SIZE)
+        
+        async def next_batch():
+            documents = await cursor.to_list(STREAM_BATCH_SIZE)
+            if documents and prepare is not None:
+                documents = await prepare(documents)
+            return documents
+        
+        async def body():
+            if not ndjson:
+                yield b"["
+            first = True
+            while True:
+                # The body outlives the request deadline, so each batch gets a time limit of its own
+                documents = await start_outside_deadline(next_batch, STREAM_BATCH_TIMEOUT_SECONDS)
+                if not documents:
+                    break
+                chunk = self.dump_json_items(documents, ndjson)
+                if not ndjson and not first:
+                    chunk = b"," + chunk
+                first = False
+                yield chunk
+            if not ndjson:
+                yield b"]"
+        
+        media_type = NDJSON_MEDIA_TYPE if ndjson else "application/json"
+        return StreamingResponse(body(), media_type=media_type, headers=headers)
+    
+    def dump_msgpack(self, documents: List[dict]) -> bytes:
+        rows = self.to_python(documents)
+        # Tagging datetimes as UTC lets msgpack pack them natively instead of calling back per value
+        for name in self.datetime_fields:
+            for row in rows:
+                value = row[name]
+                # Trusted mode passes stored values through, so legacy ISO strings are left as they are
+                if isinstance(value, datetime) and value.tzinfo is None:
+                    row[name] = value.replace(tzinfo=timezone.utc)
+        return pack_msgpack(rows)
+    
+    def response(self, documents: List[dict], headers: Optional[dict] = None) -> Response:
+        if msgpack_requested.get():
+            return Response(content=self.dump_msgpack(documents), media_type=MSGPACK_MEDIA_TYPES[0], headers=headers)
+        return Response(content=self.dump_json(documents), media_type="application/json", headers=headers)
+
+user_list_serializer = ListSerializer(User)
+project_list_serializer = ListSerializer(Project)
+task_list_serializer = ListSerializer(Task)
+task_with_users_list_serializer = ListSerializer(TaskWithUsers)
+notification_list_serializer = ListSerializer(Notification)
+file_list_serializer = ListSerializer(FileAttachment)
+comment_list_serializer = ListSerializer(Comment)
+
 # Auth helper functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -184,6 +753,206 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def access_token_claims(user: dict) -> dict:
+    """Claims that let get_current_user build the User without a DB read (STATELESS_AUTH)"""
+    created_at = user.get("created_at")
+    return {
+        "sub": user["email"],
+        "uid": user["id"],
+        "name": user["name"],
+        "role": user["role"],
+        "ver": user.get("token_version", 0),
+        "created": int(created_at.replace(tzinfo=timezone.utc).timestamp()) if isinstance(created_at, datetime) else None
+    }
+
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are 256 random bits, so a fast hash is enough; no need for bcrypt here
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def issue_refresh_token(user_id: str, family_id: Optional[str] = None,
+                              session_expires_at: Optional[datetime] = None) -> str:
+    """Store a new single-use refresh token; rotations keep the family and the session's absolute expiry"""
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    session_expires_at = session_expires_at or now + timedelta(days=REFRESH_SESSION_MAX_DAYS)
+    await db.refresh_tokens.insert_one({
+        "_id": hash_refresh_token(token),
+        "user_id": user_id,
+        "family_id": family_id or str(uuid.uuid4()),
+        "created_at": now,
+        "expires_at": min(now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), session_expires_at),
+        "session_expires_at": session_expires_at,
+        "used_at": None
+    })
+    return token
+
+class TokenRevocationList:
+    """Minimum valid token version per user, mirrored from the token_revocations collection.
+    
+    Only users who ever revoked their tokens have an entry, so the map stays small. It is refreshed
+    incrementally every TOKEN_REVOCATION_REFRESH_SECONDS, which bounds how long a revoked token is
+    still accepted by other workers in stateless mode.
+    """
+    
+    def __init__(self):
+        self.versions = {}  # user id -> minimum accepted "ver" claim
+        self.refreshed_at = None
+    
+    def is_revoked(self, user_id: str, version: int) -> bool:
+        return version < self.versions.get(user_id, 0)
+    
+    async def refresh(self):
+        query = {} if self.refreshed_at is None else {"updated_at": {"$gte": self.refreshed_at}}
+        # Small overlap so revocations written while this query runs are not skipped
+        refreshed_at = datetime.utcnow() - timedelta(seconds=1)
+        async for revocation in db.token_revocations.find(query, {"version": 1}):
+            self.versions[revocation["_id"]] = max(self.versions.get(revocation["_id"], 0), revocation["version"])
+        self.refreshed_at = refreshed_at
+    
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh token revocations")
+            await asyncio.sleep(TOKEN_REVOCATION_REFRESH_SECONDS)
+
+token_revocations = TokenRevocationList()
+
+async def revoke_user_tokens(user_id: str):
+    """Invalidate every token issued to the user so far; call after logout or a role change"""
+    user = await db.users.find_one_and_update(
+        {"id": user_id}, {"$inc": {"token_version": 1}}, {"_id": 0, "token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if user is None:
+        return
+    await db.token_revocations.update_one(
+        {"_id": user_id},
+        {"$max": {"version": user["token_version"]}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    token_revocations.versions[user_id] = user["token_version"]
+
+async def push_notification(user_id: str, title: str, message: str, type: str,
+                            task_id: Optional[str] = None, project_id: Optional[str] = None,
+                            subject: Optional[str] = None):
+    """Store a notification, folding repeated events on the same task into one aggregate"""
+    if type not in COALESCED_NOTIFICATION_MESSAGES or not task_id:
+        notification = Notification(
+            user_id=user_id,
+            title=title,
+            message=message,
+            type=type,
+            task_id=task_id,
+            project_id=project_id
+        )
+        await db.notifications.insert_one(notification.dict())
+        await bump_versions(f"notifications:{user_id}")
+        return
+    
+    digest_mode = NOTIFICATION_DIGEST_INTERVAL_SECONDS > 0
+    window = NOTIFICATION_DIGEST_INTERVAL_SECONDS if digest_mode else NOTIFICATION_COALESCE_WINDOW_SECONDS
+    now = datetime.utcnow()
+    
+    # One upsert per event: bump the open aggregate for this task, or start a new one.
+    # created_at follows the latest event so the aggregate resurfaces at the top of the list.
+    query = {
+        "user_id": user_id,
+        "type": type,
+        "task_id": task_id,
+        "read": False,
+        "window_started_at": {"$gte": now - timedelta(seconds=window)}
+    }
+    set_on_insert = {
+        "id": str(uuid.uuid4()),
+        "title": title,
+        "project_id": project_id,
+        "window_started_at": now
+    }
+    if digest_mode:
+        query["pending_digest"] = True
+        set_on_insert["pending_digest"] = True
+    
+    await db.notifications.update_one(
+        query,
+        {
+            "$inc": {"count": 1},
+            "$set": {"message": message, "subject": subject, "created_at": now},
+            "$setOnInsert": set_on_insert
+        },
+        upsert=True
+    )
+    await bump_versions(f"notifications:{user_id}")
+
+def visible_notifications_query(user_id: str) -> dict:
+    query = {"user_id": user_id}
+    if NOTIFICATION_DIGEST_INTERVAL_SECONDS > 0:
+        # Aggregates stay hidden until the next digest run releases them
+        query["pending_digest"] = {"$ne": True}
+    return query
+
+def render_notification(notification: dict) -> dict:
+    template = COALESCED_NOTIFICATION_MESSAGES.get(notification.get("type"))
+    if template and notification.get("count", 1) > 1 and notification.get("subject"):
+        notification["message"] = template.format(count=notification["count"], subject=notification["subject"])
+    return notification
+
+# Conditional GET support
+# Each list endpoint is guarded by one or more counters in collection_versions, e.g. "users",
+# "tasks:<project_id>" or "notifications:<user_id>". Writers bump the counters after writing,
+# so a probe that reads an unchanged counter is guaranteed to describe an unchanged list.
+async def bump_versions(*keys: str):
+    keys = list(dict.fromkeys(keys))
+    if len(keys) == 1:
+        await db.collection_versions.update_one({"_id": keys[0]}, {"$inc": {"v": 1}}, upsert=True)
+    elif keys:
+        await db.collection_versions.bulk_write(
+            [UpdateOne({"_id": key}, {"$inc": {"v": 1}}, upsert=True) for key in keys],
+            ordered=False
+        )
+
+async def probe_versions(*keys: str) -> dict:
+    """Current value of each version counter (0 if never bumped), in one indexed query"""
+    versions = {
+        doc["_id"]: doc["v"]
+        for doc in await db.collection_versions.find({"_id": {"$in": list(keys)}}).to_list(len(keys))
+    }
+    return {key: versions.get(key, 0) for key in keys}
+
+async def list_etag(request: Request, user_id: str, *keys: str, versions: Optional[dict] = None) -> str:
+    """Weak ETag for a list response, computed from one indexed probe of its version counters.
+    
+    Pass versions from probe_versions when the caller also needs them (e.g. for a single-flight key).
+    """
+    if versions is None:
+        versions = await probe_versions(*keys)
+    fingerprint = "|".join([
+        user_id,
+        request.url.path,
+        request.url.query,
+        "msgpack" if msgpack_requested.get() else "json",
+        *(f"{key}={versions[key]}" for key in keys)
+    ])
+    return f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()[:20]}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    opaque_tag = etag[2:]
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate == etag or candidate.removeprefix("W/") == opaque_tag:
+            return True
+    return False
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -198,13 +967,610 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.PyJWTError:
         raise credentials_exception
     
+    version = payload.get("ver", 0)
+    if STATELESS_AUTH and "uid" in payload:
+        if token_revocations.is_revoked(payload["uid"], version):
+            raise credentials_exception
+        created = payload.get("created")
+        return User(
+            id=payload["uid"], name=payload["name"], email=email, role=payload["role"],
+            **({"created_at": datetime.utcfromtimestamp(created)} if created is not None else {})
+        )
+    
     user = await db.users.find_one({"email": email})
-    if user is None:
+    if user is None or version < user.get("token_version", 0):
         raise credentials_exception
     return User(**user)
 
+# Rate limiting
+class TokenBucketStore:
+    """Per-worker token buckets. Each hit reads and writes its bucket without awaiting, so it is atomic on the event loop.
+    
+    Each limit (capacity and period) has its own table of at most max_keys buckets in least-recently-used
+    order, so keys of one limit never push out another's. Evicting the oldest bucket is O(1), and having
+    been idle longest it is the one most likely to have refilled anyway.
+    """
+    
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.limits = {}  # (capacity, period) -> OrderedDict of key -> (tokens, monotonic time of last update)
+    
+    async def hit(self, key: str, capacity: int, period: float):
+        now = time.monotonic()
+        rate = capacity / period
+        buckets = self.limits.get((capacity, period))
+        if buckets is None:
+            buckets = self.limits[(capacity, period)] = OrderedDict()
+        bucket = buckets.get(key)
+        tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        if bucket is None:
+            while len(buckets) >= self.max_keys:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+        buckets[key] = (tokens, now)
+        retry_after = 0 if allowed else (1 - tokens) / rate
+        return allowed, int(tokens), (capacity - tokens) / rate, retry_after
+
+class MongoWindowStore:
+    """Fixed-window counters in the rate_limits collection, shared by every worker; expired windows are TTL-deleted"""
+    
+    async def hit(self, key: str, capacity: int, period: float):
+        now = time.time()
+        window = int(now // period)
+        window_end = (window + 1) * period
+        counter = await db.rate_limits.find_one_and_update(
+            {"_id": f"{key}:{window}"},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": datetime.utcfromtimestamp(window_end)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        allowed = counter["count"] <= capacity
+        return allowed, max(0, capacity - counter["count"]), window_end - now, 0 if allowed else window_end - now
+
+rate_limit_store = MongoWindowStore() if RATE_LIMIT_STORE == "mongo" else TokenBucketStore(RATE_LIMIT_MAX_KEYS)
+
+def parse_rate_limit(spec: str):
+    requests, _, seconds = spec.partition("/")
+    return int(requests), float(seconds)
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def enforce_rate_limit(name: str, key: str, response: Response):
+    capacity, period = parse_rate_limit(RATE_LIMITS[name])
+    allowed, remaining, reset, retry_after = await rate_limit_store.hit(f"{name}:{key}", capacity, period)
+    headers = {
+        "X-RateLimit-Limit": str(capacity),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(max(1, round(reset)))  # Seconds until the limit is fully restored
+    }
+    if not allowed:
+        headers["Retry-After"] = str(max(1, round(retry_after)))
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=headers)
+    response.headers.update(headers)
+
+def rate_limited(name: str, per_ip: bool = False):
+    """Route dependency applying the RATE_LIMITS[name] bucket per authenticated user, or per client IP"""
+    if per_ip:
+        async def dependency(request: Request, response: Response):
+            if RATE_LIMIT_ENABLED:
+                await enforce_rate_limit(name, f"ip:{client_ip(request)}", response)
+    else:
+        async def dependency(response: Response, current_user: User = Depends(get_current_user)):
+            if RATE_LIMIT_ENABLED:
+                await enforce_rate_limit(name, f"user:{current_user.id}", response)
+    return Depends(dependency)
+
+# Batched user lookups
+class UserLoader:
+    """DataLoader-style user lookups by id.
+    
+    Ids requested during the same event-loop tick, across all requests on this worker, are resolved
+    with one $in query. Found users are cached for USER_LOADER_CACHE_TTL_SECONDS; misses are not,
+    so a user registered right after a failed lookup is visible at once.
+    Documents are returned without the password hash and must be treated as read-only.
+    """
+    
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._cache = {}  # user id -> (expires at, document or None)
+        self._pending = {}  # user id -> future awaiting the next dispatch
+    
+    async def load(self, user_id: str) -> Optional[dict]:
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        
+        future = self._pending.get(user_id)
+        if future is None:
+            if not self._pending:
+                # Shared by every caller in this tick, so not bound to the first caller's deadline
+                asyncio.get_running_loop().call_soon(start_outside_deadline, self._dispatch, SHARED_READ_TIMEOUT_SECONDS)
+            future = self._pending[user_id] = asyncio.get_running_loop().create_future()
+        # Shielded: the future is shared, and one cancelled caller must not fail the others
+        return await asyncio.shield(future)
+    
+    async def load_many(self, user_ids) -> dict:
+        """Map each id to its user document, or None when no such user exists"""
+        user_ids = list(dict.fromkeys(user_ids))
+        documents = await asyncio.gather(*(self.load(user_id) for user_id in user_ids))
+        return dict(zip(user_ids, documents))
+    
+    def invalidate(self, user_id: str):
+        self._cache.pop(user_id, None)
+    
+    async def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        try:
+            documents = await db.users.find(
+                {"id": {"$in": list(pending)}}, {"_id": 0, "password": 0, **{field: 0 for field in USER_SEARCH_FIELDS}}
+            ).to_list(len(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        if len(self._cache) + len(pending) > self.max_entries:
+            now = time.monotonic()
+            self._cache = {key: entry for key, entry in self._cache.items() if entry[0] > now}
+        found = {document["id"]: document for document in documents}
+        expires_at = time.monotonic() + self.ttl
+        for user_id, future in pending.items():
+            document = found.get(user_id)
+            if document is not None and len(self._cache) < self.max_entries:
+                self._cache[user_id] = (expires_at, document)
+            if not future.done():
+                future.set_result(document)
+
+user_loader = UserLoader(USER_LOADER_CACHE_TTL_SECONDS, USER_LOADER_CACHE_MAX_ENTRIES)
+
+def user_summary(user: Optional[dict]) -> Optional[dict]:
+    if user is None:
+        return None
+    return {"id": user["id"], "name": user["name"], "email": user["email"]}
+
+async def embed_task_users(tasks: List[dict]) -> List[dict]:
+    """Copy tasks with assignee and creator display info, loading all users in one batch"""
+    user_ids = [task["created_by"] for task in tasks]
+    user_ids.extend(task["assigned_to"] for task in tasks if task.get("assigned_to"))
+    users = await user_loader.load_many(user_ids)
+    return [
+        {
+            **task,
+            "assignee": user_summary(users.get(task.get("assigned_to"))),
+            "creator": user_summary(users.get(task["created_by"]))
+        }
+        for task in tasks
+    ]
+
+# Single-flight reads
+class SingleFlight:
+    """Let concurrent identical reads share one in-flight DB call and its result.
+    
+    Keys are tuples of (query name, access scope, ...) and must capture everything the result
+    depends on. Callers get the same result object, so they must treat it as read-only.
+    """
+    
+    def __init__(self):
+        self._in_flight = {}  # key -> future
+        self.executed = {}  # query name -> calls that hit the database
+        self.coalesced = {}  # query name -> calls that joined an in-flight call
+    
+    async def do(self, key: tuple, fn):
+        name = key[0]
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced[name] = self.coalesced.get(name, 0) + 1
+        else:
+            self.executed[name] = self.executed.get(name, 0) + 1
+            # Later callers wait on this too, so it runs under its own time limit, not the first caller's deadline
+            future = start_outside_deadline(fn, SHARED_READ_TIMEOUT_SECONDS)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded so one caller disconnecting does not cancel the call for the others
+        return await asyncio.shield(future)
+    
+    def _forget(self, key: tuple, future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        if not future.cancelled():
+            future.exception()  # Mark retrieved in case every caller went away
+    
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "queries": [
+                {"query": name, "executed": self.executed.get(name, 0), "coalesced": self.coalesced.get(name, 0)}
+                for name in sorted(set(self.executed) | set(self.coalesced))
+            ]
+        }
+
+single_flight = SingleFlight()
+
+# Access control
+PROJECT_VIEW = "view"  # Project owner or team member
+PROJECT_MANAGE = "manage"  # Project owner only
+
+class ProjectAccessCache:
+    """Per-worker map of project membership and task -> project ownership.
+    
+    Membership entries expire after PROJECT_ACCESS_CACHE_TTL_SECONDS so changes made
+    through another worker are picked up; this worker drops them immediately on team updates.
+    A task never moves between projects, so task entries only leave the cache on delete or eviction.
+    """
+    
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_entries = max_entries
+        self._projects = {}  # project_id -> (expires_at, owner_id, frozenset of member ids)
+        self._task_projects = {}  # task_id -> project_id
+    
+    def _evict(self, entries: dict):
+        # Oldest-first eviction; dicts keep insertion order
+        while len(entries) >= self.max_entries:
+            entries.pop(next(iter(entries)))
+    
+    def get_project(self, project_id: str):
+        entry = self._projects.get(project_id)
+        if entry is None:
+            return None
+        if entry[0] < datetime.utcnow():
+            self._projects.pop(project_id, None)
+            return None
+        return entry[1], entry[2]
+    
+    def put_project(self, project: dict):
+        self._evict(self._projects)
+        owner_id = project["owner_id"]
+        members = frozenset(project.get("team_members", []))
+        self._projects[project["id"]] = (datetime.utcnow() + self.ttl, owner_id, members)
+        return owner_id, members
+    
+    def invalidate_project(self, project_id: str):
+        self._projects.pop(project_id, None)
+    
+    def get_task_project(self, task_id: str) -> Optional[str]:
+        return self._task_projects.get(task_id)
+    
+    def put_task_project(self, task_id: str, project_id: str):
+        if task_id not in self._task_projects:
+            self._evict(self._task_projects)
+        self._task_projects[task_id] = project_id
+    
+    def forget_task(self, task_id: str):
+        self._task_projects.pop(task_id, None)
+
+project_access_cache = ProjectAccessCache(PROJECT_ACCESS_CACHE_TTL_SECONDS, PROJECT_ACCESS_CACHE_MAX_ENTRIES)
+
+class AccessResolver:
+    """Answers "can the current user do action A on task/project X" for one request"""
+    
+    def __init__(self, user: User):
+        self.user = user
+    
+    async def project_membership(self, project_id: str):
+        """Return (owner_id, member ids) for a project, or None if it does not exist"""
+        membership = project_access_cache.get_project(project_id)
+        if membership is None:
+            project = await db.projects.find_one(
+                {"id": project_id},
+                {"_id": 0, "id": 1, "owner_id": 1, "team_members": 1}
+            )
+            if not project:
+                return None
+            membership = project_access_cache.put_project(project)
+        return membership
+    
+    async def preload_projects(self, project_ids):
+        """Load the memberships of every uncached project in one $in query, ahead of per-project checks"""
+        missing = [project_id for project_id in project_ids if project_access_cache.get_project(project_id) is None]
+        if not missing:
+            return
+        async for project in db.projects.find(
+            {"id": {"$in": missing}}, {"_id": 0, "id": 1, "owner_id": 1, "team_members": 1}
+        ):
+            project_access_cache.put_project(project)
+    
+    async def can(self, action: str, project_id: str) -> bool:
+        membership = await self.project_membership(project_id)
+        if membership is None:
+            return False
+        owner_id, members = membership
+        if owner_id == self.user.id:
+            return True
+        return action == PROJECT_VIEW and self.user.id in members
+    
+    async def require_project(self, project_id: str, action: str = PROJECT_VIEW,
+                              detail: str = "Project not found or access denied"):
+        if not await self.can(action, project_id):
+            raise HTTPException(status_code=404, detail=detail)
+    
+    def remember_task(self, task: dict):
+        project_access_cache.put_task_project(task["id"], task["project_id"])
+    
+    async def task_project(self, task_id: str) -> Optional[str]:
+        project_id = project_access_cache.get_task_project(task_id)
+        if project_id is None:
+            task = await db.tasks.find_one({"id": task_id}, {"_id": 0, "id": 1, "project_id": 1})
+            if not task:
+                return None
+            self.remember_task(task)
+            project_id = task["project_id"]
+        return project_id
+    
+    async def require_task(self, task_id: str, action: str = PROJECT_VIEW,
+                           detail: str = "Project not found or access denied") -> str:
+        """Check access to a task's project and return the project id"""
+        project_id = await self.task_project(task_id)
+        if project_id is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        await self.require_project(project_id, action, detail)
+        return project_id
+
+async def get_access_resolver(current_user: User = Depends(get_current_user)) -> AccessResolver:
+    return AccessResolver(current_user)
+
+# Optimistic concurrency helpers
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Return the document version the client expects, or None for an unconditional write"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+def version_filter(expected_version: Optional[int]) -> dict:
+    if expected_version is None:
+        return {}
+    if expected_version == 0:
+        # Documents written before versioning have no version field
+        return {"version": {"$in": [0, None]}}
+    return {"version": expected_version}
+
+def set_version_etag(response: Response, document: dict):
+    response.headers["ETag"] = f'"{document.get("version", 0)}"'
+
+async def raise_write_miss(collection, query: dict, detail: str):
+    """Explain why a conditional find_one_and_update matched nothing"""
+    if await collection.find_one(query, {"_id": 1}):
+        raise HTTPException(status_code=412, detail="Resource was modified by another request; reload and retry")
+    raise HTTPException(status_code=404, detail=detail)
+
+# Project membership helpers
+async def ensure_users_exist(user_ids: List[str]):
+    """Reject unknown user ids with one batched $in lookup"""
+    if not user_ids:
+        return
+    found = await user_loader.load_many(user_ids)
+    missing = {user_id for user_id, user in found.items() if user is None}
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Unknown user ids: {', '.join(sorted(missing))}")
+
+async def add_project_memberships(project_id: str, user_ids: List[str], role: str = "member"):
+    # Written whatever USE_PROJECT_MEMBERSHIPS says, so the mirror is current whenever reads switch to it
+    if not user_ids:
+        return
+    now = datetime.utcnow()
+    await db.project_memberships.bulk_write([
+        UpdateOne(
+            {"project_id": project_id, "user_id": user_id},
+            {"$setOnInsert": {"project_id": project_id, "user_id": user_id, "role": role, "added_at": now}},
+            upsert=True
+        )
+        for user_id in user_ids
+    ], ordered=False)
+
+async def sync_project_memberships(project_id: str, team_members: List[str]):
+    """Make the memberships mirror match a full team list"""
+    await db.project_memberships.delete_many({
+        "project_id": project_id,
+        "user_id": {"$nin": team_members},
+        "role": {"$ne": "owner"}
+    })
+    await add_project_memberships(project_id, team_members)
+
+async def remove_project_memberships(project_id: str, user_ids: List[str]):
+    if not user_ids:
+        return
+    await db.project_memberships.delete_many({
+        "project_id": project_id,
+        "user_id": {"$in": user_ids},
+        "role": {"$ne": "owner"}
+    })
+
+async def find_accessible_projects(user_id: str, projection: Optional[dict] = None) -> List[dict]:
+    """Projects the user owns or is a team member of"""
+    if USE_PROJECT_MEMBERSHIPS:
+        memberships = await db.project_memberships.find(
+            {"user_id": user_id}, {"_id": 0, "project_id": 1}
+        ).to_list(1000)
+        query = {"id": {"$in": [m["project_id"] for m in memberships]}}
+    else:
+        query = {
+            "$or": [
+                {"owner_id": user_id},  # Projects user owns
+                {"team_members": user_id}  # Projects user is a team member of
+            ]
+        }
+    return await db.projects.find(query, projection).to_list(1000)
+
+async def migrate_project_memberships(batch_size: int = 1000):
+    """Reconcile project_memberships with the team_members arrays.
+    
+    Adds missing rows and deletes rows for users no longer on the team (left behind by earlier
+    versions that only mirrored while USE_PROJECT_MEMBERSHIPS was on). Idempotent and safe to run
+    from several workers at once; a marker skips it once done.
+    """
+    if await db.migrations.find_one({"_id": "project_memberships_reconciled"}):
+        return
+    
+    operations = []
+    now = datetime.utcnow()
+    async for project in db.projects.find({}, {"_id": 0, "id": 1, "owner_id": 1, "team_members": 1}):
+        members = [(project["owner_id"], "owner")] + [
+            (user_id, "member") for user_id in project.get("team_members", []) if user_id != project["owner_id"]
+        ]
+        operations.append(DeleteMany({
+            "project_id": project["id"],
+            "user_id": {"$nin": [user_id for user_id, _ in members]}
+        }))
+        for user_id, role in members:
+            operations.append(UpdateOne(
+                {"project_id": project["id"], "user_id": user_id},
+                {"$setOnInsert": {"project_id": project["id"], "user_id": user_id, "role": role, "added_at": now}},
+                upsert=True
+            ))
+        if len(operations) >= batch_size:
+            await db.project_memberships.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db.project_memberships.bulk_write(operations, ordered=False)
+    
+    # Upserted, since concurrent workers may all finish the reconcile
+    await db.migrations.update_one(
+        {"_id": "project_memberships_reconciled"},
+        {"$setOnInsert": {"completed_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+# User search helpers
+def normalize_search_text(text: str) -> str:
+    """Lowercase and strip accents, so that "José" is found by "jose"."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+# Search keys stored on each user; they are only used in queries and never returned
+USER_SEARCH_FIELDS = ("search_name", "name_terms", "search_terms")
+
+def user_search_fields(name: str, email: str) -> dict:
+    """Prefix-searchable keys for a user, one field per ranking tier.
+    
+    search_name is the full name, name_terms its words, and search_terms every key
+    including the email and its local part.
+    """
+    search_name = normalize_search_text(name)
+    name_terms = [word for word in re.split(r"[^\w]+", search_name) if word]
+    email = normalize_search_text(email)
+    terms = [search_name, email, email.split("@")[0]] + name_terms
+    return {
+        "search_name": search_name,
+        "name_terms": list(dict.fromkeys(name_terms)),
+        "search_terms": list(dict.fromkeys(term for term in terms if term))
+    }
+
+async def backfill_user_search_terms(batch_size: int = 1000):
+    """Add the search fields to users created before user search existed, or before it was tiered (no-op once done)"""
+    operations = []
+    async for user in db.users.find({"name_terms": {"$exists": False}}, {"_id": 1, "name": 1, "email": 1}):
+        operations.append(UpdateOne({"_id": user["_id"]}, {"$set": user_search_fields(user["name"], user["email"])}))
+        if len(operations) >= batch_size:
+            await db.users.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db.users.bulk_write(operations, ordered=False)
+
+# Task query helpers
+# Sort keys accepted by get_tasks; title sorts on the normalized copy so case does not split the order
+TASK_SORT_FIELDS = {"due_date": "due_date", "created_at": "created_at", "title": "title_lower"}
+
+def task_document(task: "Task") -> dict:
+    """Stored form of a task: the model plus the normalized title used for prefix filters and sorting"""
+    return {**task.dict(), "title_lower": normalize_search_text(task.title)}
+
+def to_naive_utc(value: datetime) -> datetime:
+    # Stored datetimes are naive UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def task_filters(status: Optional[List[str]], assigned_to: Optional[str], created_by: Optional[str],
+                 due_after: Optional[datetime], due_before: Optional[datetime], q: Optional[str]) -> dict:
+    filters = {}
+    if status:
+        filters["status"] = status[0] if len(status) == 1 else {"$in": status}
+    if assigned_to:
+        filters["assigned_to"] = assigned_to
+    if created_by:
+        filters["created_by"] = created_by
+    if due_after or due_before:
+        filters["due_date"] = {
+            **({"$gte": to_naive_utc(due_after)} if due_after else {}),
+            **({"$lte": to_naive_utc(due_before)} if due_before else {})
+        }
+    if q and normalize_search_text(q):
+        filters["title_lower"] = {"$regex": "^" + re.escape(normalize_search_text(q))}
+    return filters
+
+def task_sort(sort: Optional[str]):
+    """"due_date" or "-due_date" style sort key -> pymongo sort spec (None keeps natural order)"""
+    if not sort:
+        return None
+    field = TASK_SORT_FIELDS.get(sort.lstrip("-"))
+    if field is None:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(TASK_SORT_FIELDS)} (prefix - for descending)")
+    return [(field, -1 if sort.startswith("-") else 1)]
+
+async def backfill_task_title_lower(batch_size: int = 1000):
+    """Add title_lower to tasks created before server-side filtering existed (no-op once done)"""
+    operations = []
+    async for task in db.tasks.find({"title_lower": {"$exists": False}}, {"_id": 1, "title": 1}):
+        operations.append(UpdateOne({"_id": task["_id"]}, {"$set": {"title_lower": normalize_search_text(task["title"])}}))
+        if len(operations) >= batch_size:
+            await db.tasks.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db.tasks.bulk_write(operations, ordered=False)
+
+# Full-text search helpers
+def search_highlight_pattern(q: str):
+    """Words starting with a query term, its last two letters trimmed to roughly follow the text index's stemming"""
+    stems = {term[:-2] if len(term) > 4 else term for term in re.findall(r"\w+", q.lower())}
+    if not stems:
+        return None
+    return re.compile(r"\b(?:" + "|".join(re.escape(stem) for stem in sorted(stems, key=len, reverse=True)) + r")\w*", re.IGNORECASE)
+
+def search_snippet(text: str, pattern) -> dict:
+    """A window of text around the first match, with [start, end) offsets of every match inside it"""
+    text = text or ""
+    first = pattern.search(text) if pattern is not None else None
+    start = 0
+    if first is not None and len(text) > SEARCH_SNIPPET_CHARS:
+        start = max(0, min(first.start() - SEARCH_SNIPPET_CHARS // 3, len(text) - SEARCH_SNIPPET_CHARS))
+    end = min(len(text), start + SEARCH_SNIPPET_CHARS)
+    prefix = "\u2026" if start > 0 else ""
+    snippet = prefix + text[start:end] + ("\u2026" if end < len(text) else "")
+    highlights = [] if pattern is None else [
+        [match.start() + len(prefix), match.end() + len(prefix)] for match in pattern.finditer(text[start:end])
+    ]
+    return {"snippet": snippet, "highlights": highlights}
+
+async def backfill_comment_projects(batch_size: int = 1000):
+    """Store project_id on comments written before search existed (no-op once done)"""
+    task_ids = await db.comments.distinct("task_id", {"project_id": {"$exists": False}})
+    for offset in range(0, len(task_ids), batch_size):
+        tasks = await db.tasks.find(
+            {"id": {"$in": task_ids[offset:offset + batch_size]}}, {"_id": 0, "id": 1, "project_id": 1}
+        ).to_list(None)
+        if tasks:
+            await db.comments.bulk_write([
+                UpdateMany({"task_id": task["id"], "project_id": {"$exists": False}}, {"$set": {"project_id": task["project_id"]}})
+                for task in tasks
+            ], ordered=False)
+
 # Auth Routes
-@api_router.post("/auth/register", response_model=Token)
+@api_router.post("/auth/register", response_model=Token, dependencies=[rate_limited("auth", per_ip=True)])
 async def register(user: UserCreate):
     # Check if user exists
     existing_user = await db.users.find_one({"email": user.email})
@@ -218,18 +1584,22 @@ async def register(user: UserCreate):
     user_obj = User(name=user.name, email=user.email, role=user.role)
     user_dict = user_obj.dict()
     user_dict["password"] = hashed_password
+    user_dict.update(user_search_fields(user_obj.name, user_obj.email))
     
     await db.users.insert_one(user_dict)
+    user_loader.invalidate(user_obj.id)
+    await bump_versions("users")
     
     # Create token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=access_token_claims(user_dict), expires_delta=access_token_expires
     )
+    refresh_token = await issue_refresh_token(user_obj.id)
     
-    return Token(access_token=access_token, token_type="bearer", user=user_obj)
+    return Token(access_token=access_token, token_type="bearer", user=user_obj, refresh_token=refresh_token)
 
-@api_router.post("/auth/login", response_model=Token)
+@api_router.post("/auth/login", response_model=Token, dependencies=[rate_limited("auth", per_ip=True)])
 async def login(user_login: UserLogin):
     user = await db.users.find_one({"email": user_login.email})
     if not user or not verify_password(user_login.password, user["password"]):
@@ -241,11 +1611,57 @@ async def login(user_login: UserLogin):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
+        data=access_token_claims(user), expires_delta=access_token_expires
     )
+    refresh_token = await issue_refresh_token(user["id"])
     
     user_obj = User(**user)
-    return Token(access_token=access_token, token_type="bearer", user=user_obj)
+    return Token(access_token=access_token, token_type="bearer", user=user_obj, refresh_token=refresh_token)
+
+@api_router.post("/auth/refresh", response_model=Token)
+async def refresh_session(refresh_request: RefreshRequest):
+    """Exchange a refresh token for a new access token and a rotated refresh token, without a password check"""
+    invalid_refresh_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    token_hash = hash_refresh_token(refresh_request.refresh_token)
+    now = datetime.utcnow()
+    
+    # Claim the token atomically; only one request can ever use it. Expired tokens linger until the
+    # TTL monitor runs, so expiry is part of the claim: retrying an expired token is not reuse.
+    stored = await db.refresh_tokens.find_one_and_update(
+        {"_id": token_hash, "used_at": None, "expires_at": {"$gt": now}},
+        {"$set": {"used_at": now}}
+    )
+    if stored is None:
+        reused = await db.refresh_tokens.find_one({"_id": token_hash})
+        if reused is not None and reused.get("used_at") is not None and reused["expires_at"] > now:
+            # A rotated-out token came back: someone holds a copy. End the whole session family,
+            # and the access tokens issued to the user so far.
+            logger.warning("Refresh token reuse detected for user %s; revoking session", reused["user_id"])
+            await db.refresh_tokens.delete_many({"family_id": reused["family_id"]})
+            await revoke_user_tokens(reused["user_id"])
+        raise invalid_refresh_token
+    
+    user = await db.users.find_one({"id": stored["user_id"]}, {"_id": 0, "password": 0, **{field: 0 for field in USER_SEARCH_FIELDS}})
+    if user is None:
+        raise invalid_refresh_token
+    
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data=access_token_claims(user), expires_delta=access_token_expires
+    )
+    refresh_token = await issue_refresh_token(user["id"], stored["family_id"], stored["session_expires_at"])
+    return Token(access_token=access_token, token_type="bearer", user=User(**user), refresh_token=refresh_token)
+
+@api_router.post("/auth/logout")
+async def logout(current_user: User = Depends(get_current_user)):
+    """Revoke every access and refresh token issued to the current user"""
+    await revoke_user_tokens(current_user.id)
+    await db.refresh_tokens.delete_many({"user_id": current_user.id})
+    return {"message": "Logged out successfully"}
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(current_user: User = Depends(get_current_user)):
@@ -253,13 +1669,50 @@ async def get_me(current_user: User = Depends(get_current_user)):
 
 # User Routes
 @api_router.get("/users", response_model=List[User])
-async def get_users(current_user: User = Depends(get_current_user)):
+async def get_users(request: Request, current_user: User = Depends(get_current_user)):
     """Get all users for team management (authenticated users only)"""
+    etag = await list_etag(request, current_user.id, "users")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
     users = await db.users.find({}).to_list(1000)
-    return [User(**user) for user in users]
+    return user_list_serializer.response(users, headers={"ETag": etag})
+
+@api_router.get("/users/search", response_model=List[User])
+async def search_users(q: str, limit: int = 10, project_id: Optional[str] = None,
+                       access: AccessResolver = Depends(get_access_resolver)):
+    """Users whose name, any name word or email starts with q; optionally only members of project_id"""
+    prefix = normalize_search_text(q)
+    if not prefix:
+        return []
+    limit = min(max(limit, 1), USER_SEARCH_MAX_RESULTS)
+    
+    allowed_ids = None
+    if project_id:
+        await access.require_project(project_id)
+        owner_id, members = await access.project_membership(project_id)
+        allowed_ids = [owner_id, *members]
+    
+    # One query per ranking tier, best first, each only filling what the earlier ones left:
+    # full name prefix, then a later name word, then email. Anchored, case-sensitive regexes on the
+    # normalized fields are bounded index scans.
+    pattern = {"$regex": "^" + re.escape(prefix)}
+    results = []
+    for field in ("search_name", "name_terms", "search_terms"):
+        seen = {user["id"] for user in results}
+        query = {field: pattern}
+        if allowed_ids is not None:
+            query["id"] = {"$in": [user_id for user_id in allowed_ids if user_id not in seen]}
+        elif seen:
+            query["id"] = {"$nin": list(seen)}
+        remaining = limit - len(results)
+        results += await db.users.find(query, {"_id": 0, "password": 0}).sort("search_name", 1).limit(remaining).to_list(remaining)
+        if len(results) >= limit:
+            break
+    return user_list_serializer.response(results)
 
 # Project Routes
-@api_router.post("/projects", response_model=Project)
+@api_router.post("/projects", response_model=Project, dependencies=[rate_limited("writes")])
 async def create_project(project: ProjectCreate, current_user: User = Depends(get_current_user)):
     project_obj = Project(
         title=project.title,
@@ -268,23 +1721,29 @@ async def create_project(project: ProjectCreate, current_user: User = Depends(ge
         team_members=[]  # Initialize with empty team
     )
     await db.projects.insert_one(project_obj.dict())
+    await add_project_memberships(project_obj.id, [current_user.id], role="owner")
+    await bump_versions("projects")
+    project_access_cache.put_project(project_obj.dict())
     return project_obj
 
 @api_router.get("/projects", response_model=List[Project])
-async def get_projects(current_user: User = Depends(get_current_user)):
+async def get_projects(request: Request, current_user: User = Depends(get_current_user)):
+    etag = await list_etag(request, current_user.id, "projects")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
     projects = await db.projects.find({"owner_id": current_user.id}).to_list(1000)
-    return [Project(**project) for project in projects]
+    return project_list_serializer.response(projects, headers={"ETag": etag})
 
 @api_router.get("/projects/accessible", response_model=List[Project])
-async def get_accessible_projects(current_user: User = Depends(get_current_user)):
+async def get_accessible_projects(request: Request, current_user: User = Depends(get_current_user)):
     """Get projects user owns OR is a team member of"""
-    projects = await db.projects.find({
-        "$or": [
-            {"owner_id": current_user.id},  # Projects user owns
-            {"team_members": current_user.id}  # Projects user is a team member of
-        ]
-    }).to_list(1000)
-    return [Project(**project) for project in projects]
+    etag = await list_etag(request, current_user.id, "projects")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    projects = await find_accessible_projects(current_user.id)
+    return project_list_serializer.response(projects, headers={"ETag": etag})
 
 @api_router.get("/projects/{project_id}", response_model=Project)
 async def get_project(project_id: str, current_user: User = Depends(get_current_user)):
@@ -293,40 +1752,78 @@ async def get_project(project_id: str, current_user: User = Depends(get_current_
         raise HTTPException(status_code=404, detail="Project not found")
     return Project(**project)
 
-@api_router.put("/projects/{project_id}/team", response_model=Project)
-async def update_project_team(project_id: str, team_update: ProjectTeamUpdate, current_user: User = Depends(get_current_user)):
+@api_router.put("/projects/{project_id}/team", response_model=Project, dependencies=[rate_limited("writes")])
+async def update_project_team(project_id: str, team_update: ProjectTeamUpdate, response: Response,
+                              if_match: Optional[str] = Header(None),
+                              current_user: User = Depends(get_current_user)):
     """Add/remove team members from project (only project owner can do this)"""
-    project = await db.projects.find_one({"id": project_id, "owner_id": current_user.id})
+    expected_version = parse_if_match(if_match)
+    team_members = list(dict.fromkeys(team_update.team_members))
+    await ensure_users_exist(team_members)
+    
+    # Ownership check, version check and update in one round trip
+    owner_filter = {"id": project_id, "owner_id": current_user.id}
+    project = await db.projects.find_one_and_update(
+        {**owner_filter, **version_filter(expected_version)},
+        {"$set": {"team_members": team_members}, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
+    )
     if not project:
-        raise HTTPException(status_code=404, detail="Project not found or you're not the owner")
+        await raise_write_miss(db.projects, owner_filter, "Project not found or you're not the owner")
+    project_access_cache.invalidate_project(project_id)
+    await sync_project_memberships(project_id, team_members)
+    await bump_versions("projects")
     
-    # Update team members
-    await db.projects.update_one(
-        {"id": project_id},
-        {"$set": {"team_members": team_update.team_members}}
+    set_version_etag(response, project)
+    return Project(**project)
+
+@api_router.patch("/projects/{project_id}/team", response_model=Project, dependencies=[rate_limited("writes")])
+async def change_project_team(project_id: str, team_diff: ProjectTeamDiff, response: Response,
+                              if_match: Optional[str] = Header(None),
+                              current_user: User = Depends(get_current_user)):
+    """Add and/or remove individual team members (only project owner can do this)"""
+    to_add = list(dict.fromkeys(team_diff.add))
+    to_remove = list(dict.fromkeys(team_diff.remove))
+    if set(to_add) & set(to_remove):
+        raise HTTPException(status_code=400, detail="A user cannot be both added and removed")
+    if not to_add and not to_remove:
+        raise HTTPException(status_code=400, detail="Nothing to add or remove")
+    await ensure_users_exist(to_add)
+    
+    # One pipeline update applies both sides atomically, keeping existing members in order.
+    # Client ids are $literal so a value like "$$member" is compared as text, never evaluated.
+    owner_filter = {"id": project_id, "owner_id": current_user.id}
+    current = {"$ifNull": ["$team_members", []]}
+    team_members = {"$concatArrays": [
+        {"$filter": {"input": current, "as": "member",
+                     "cond": {"$not": {"$in": ["$$member", {"$literal": to_remove}]}}}},
+        {"$filter": {"input": {"$literal": to_add}, "as": "member", "cond": {"$not": {"$in": ["$$member", current]}}}}
+    ]}
+    project = await db.projects.find_one_and_update(
+        {**owner_filter, **version_filter(parse_if_match(if_match))},
+        [{"$set": {"team_members": team_members, "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}}}],
+        return_document=ReturnDocument.AFTER
     )
+    if not project:
+        await raise_write_miss(db.projects, owner_filter, "Project not found or you're not the owner")
+    project_access_cache.invalidate_project(project_id)
     
-    # Get updated project
-    updated_project = await db.projects.find_one({"id": project_id})
-    return Project(**updated_project)
+    await add_project_memberships(project_id, to_add)
+    await remove_project_memberships(project_id, to_remove)
+    await bump_versions("projects")
+    set_version_etag(response, project)
+    return Project(**project)
 
 # Task Routes
-@api_router.post("/tasks", response_model=Task)
-async def create_task(task: TaskCreate, current_user: User = Depends(get_current_user)):
+@api_router.post("/tasks", response_model=Task, dependencies=[rate_limited("writes")])
+async def create_task(task: TaskCreate, current_user: User = Depends(get_current_user),
+                      access: AccessResolver = Depends(get_access_resolver)):
     # Only managers can create tasks
     if current_user.role != "Manager":
         raise HTTPException(status_code=403, detail="Only team managers can create tasks")
     
     # Verify project exists and user has access (owner or team member)
-    project = await db.projects.find_one({
-        "id": task.project_id,
-        "$or": [
-            {"owner_id": current_user.id},  # Project owner
-            {"team_members": current_user.id}  # Team member
-        ]
-    })
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found or access denied")
+    await access.require_project(task.project_id)
     
     task_obj = Task(
         title=task.title,
@@ -337,13 +1834,15 @@ async def create_task(task: TaskCreate, current_user: User = Depends(get_current
         status=task.status,
         created_by=current_user.id
     )
-    await db.tasks.insert_one(task_obj.dict())
+    await db.tasks.insert_one(task_document(task_obj))
+    await bump_versions("tasks", f"tasks:{task.project_id}")
+    access.remember_task(task_obj.dict())
     
     # Create notification if task is assigned to someone
     if task.assigned_to and task.assigned_to != current_user.id:
-        assigned_user = await db.users.find_one({"id": task.assigned_to})
+        assigned_user = await user_loader.load(task.assigned_to)
         if assigned_user:
-            notification = Notification(
+            await push_notification(
                 user_id=task.assigned_to,
                 title="Task Assigned",
                 message=f"You have been assigned to task: {task.title}",
@@ -351,72 +1850,115 @@ async def create_task(task: TaskCreate, current_user: User = Depends(get_current
                 task_id=task_obj.id,
                 project_id=task.project_id
             )
-            await db.notifications.insert_one(notification.dict())
     
     return task_obj
 
 @api_router.get("/tasks", response_model=List[Task])
-async def get_tasks(project_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+async def get_tasks(request: Request, project_id: Optional[str] = None, stream: bool = False,
+                    include_users: bool = False,
+                    status: Optional[List[str]] = Query(None), assigned_to: Optional[str] = None,
+                    created_by: Optional[str] = None, due_after: Optional[datetime] = None,
+                    due_before: Optional[datetime] = None, q: Optional[str] = None, sort: Optional[str] = None,
+                    current_user: User = Depends(get_current_user),
+                    access: AccessResolver = Depends(get_access_resolver)):
+    """List tasks.
+    
+    stream=true (or Accept: application/x-ndjson) streams the full result without the 1000 cap;
+    include_users=true embeds assignee and creator display info.
+    Filters: status (repeatable), assigned_to, created_by, due_after/due_before, q (title prefix);
+    sort: due_date, created_at or title, prefixed with - for descending.
+    """
+    filters = task_filters(status, assigned_to, created_by, due_after, due_before, q)
+    sort_spec = task_sort(sort)
+    serializer = task_with_users_list_serializer if include_users else task_list_serializer
+    prepare = embed_task_users if include_users else None
+    version_keys = ("users",) if include_users else ()
+    stream = stream or wants_ndjson(request)
     if project_id:
         # Verify project access (owner OR team member OR has assigned tasks)
-        project = await db.projects.find_one({"id": project_id})
-        if not project:
+        if await access.project_membership(project_id) is None:
             raise HTTPException(status_code=404, detail="Project not found")
         
         # Check if user has access (owner, team member, or assigned tasks)
         has_access = (
-            project["owner_id"] == current_user.id or  # Owner
-            current_user.id in project.get("team_members", []) or  # Team member
+            await access.can(PROJECT_VIEW, project_id) or  # Owner or team member
             bool(await db.tasks.find_one({"project_id": project_id, "assigned_to": current_user.id}))  # Has assigned tasks
         )
         
         if not has_access:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        tasks = await db.tasks.find({"project_id": project_id}).to_list(1000)
+        versions = await probe_versions(f"tasks:{project_id}", *version_keys)
+        etag = await list_etag(request, current_user.id, *versions, versions=versions)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        
+        query = {"project_id": project_id}
     else:
+        # The cross-project list also changes when the user joins or leaves a project
+        versions = await probe_versions("tasks", "projects", *version_keys)
+        etag = await list_etag(request, current_user.id, *versions, versions=versions)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        
         # Get all accessible projects
-        accessible_projects = await db.projects.find({
-            "$or": [
-                {"owner_id": current_user.id},
-                {"team_members": current_user.id}
-            ]
-        }).to_list(1000)
+        accessible_projects = await find_accessible_projects(current_user.id, {"_id": 0, "id": 1})
         project_ids = [p["id"] for p in accessible_projects]
         
         # Get tasks from accessible projects OR assigned to user
-        tasks = await db.tasks.find({
+        query = {
             "$or": [
                 {"project_id": {"$in": project_ids}},
                 {"assigned_to": current_user.id}
             ]
-        }).to_list(1000)
+        }
     
-    return [Task(**task) for task in tasks]
-
-@api_router.put("/tasks/{task_id}/status")
-async def update_task_status(task_id: str, status: dict, current_user: User = Depends(get_current_user)):
-    # Find task and verify access
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    query.update(filters)
     
-    # Verify project access
-    project = await db.projects.find_one({"id": task["project_id"], "owner_id": current_user.id})
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    def find_tasks():
+        cursor = db.tasks.find(query)
+        return cursor.sort(sort_spec) if sort_spec else cursor
     
-    old_status = task["status"]
+    if stream:
+        return serializer.stream(find_tasks(), ndjson=wants_ndjson(request), headers={"ETag": etag},
+                                 prepare=prepare)
+    # Everyone allowed to see the project board runs the same query, so concurrent loads share it.
+    # The probed versions are part of the key: a request that saw a write must not join a read
+    # that started before it, or the old list would go out under the new ETag and later polls would 304.
+    scope = ("project", project_id) if project_id else ("user", current_user.id)
+    key = ("tasks.list",) + scope + (request.url.query, tuple(versions.items()))
+    tasks = await single_flight.do(key, lambda: find_tasks().to_list(1000))
+    if prepare is not None:
+        tasks = await prepare(tasks)
+    return serializer.response(tasks, headers={"ETag": etag})
+
+@api_router.put("/tasks/{task_id}/status", dependencies=[rate_limited("writes")])
+async def update_task_status(task_id: str, status: dict, response: Response,
+                             if_match: Optional[str] = Header(None),
+                             current_user: User = Depends(get_current_user),
+                             access: AccessResolver = Depends(get_access_resolver)):
+    expected_version = parse_if_match(if_match)
+    
+    # Verify project access (served from the membership cache when warm)
+    project_id = await access.require_task(task_id, PROJECT_MANAGE, detail="Project not found")
     new_status = status["status"]
     
-    # Update status
-    await db.tasks.update_one({"id": task_id}, {"$set": {"status": new_status}})
+    # Update status atomically; the pre-image gives us the old status for notifications
+    task = await db.tasks.find_one_and_update(
+        {"id": task_id, "project_id": project_id, **version_filter(expected_version)},
+        {"$set": {"status": new_status}, "$inc": {"version": 1}},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not task:
+        await raise_write_miss(db.tasks, {"id": task_id}, "Task not found")
+    await bump_versions("tasks", f"tasks:{project_id}")
+    old_status = task["status"]
     
     # Create notification for status change
     if old_status != new_status:
         # Notify task owner if different from user making the change
         if task["created_by"] != current_user.id:
-            notification = Notification(
+            await push_notification(
                 user_id=task["created_by"],
                 title="Task Status Updated",
                 message=f"Task '{task['title']}' status changed from {old_status} to {new_status}",
@@ -424,11 +1966,10 @@ async def update_task_status(task_id: str, status: dict, current_user: User = De
                 task_id=task_id,
                 project_id=task["project_id"]
             )
-            await db.notifications.insert_one(notification.dict())
         
         # Notify assigned user if different from both owner and user making the change
         if task.get("assigned_to") and task["assigned_to"] != current_user.id and task["assigned_to"] != task["created_by"]:
-            notification = Notification(
+            await push_notification(
                 user_id=task["assigned_to"],
                 title="Task Status Updated",
                 message=f"Task '{task['title']}' status changed from {old_status} to {new_status}",
@@ -436,28 +1977,184 @@ async def update_task_status(task_id: str, status: dict, current_user: User = De
                 task_id=task_id,
                 project_id=task["project_id"]
             )
-            await db.notifications.insert_one(notification.dict())
     
-    # Get updated task
-    updated_task = await db.tasks.find_one({"id": task_id})
+    updated_task = {**task, "status": new_status, "version": task.get("version", 0) + 1}
+    set_version_etag(response, updated_task)
     return Task(**updated_task)
 
-@api_router.delete("/tasks/{task_id}")
-async def delete_task(task_id: str, current_user: User = Depends(get_current_user)):
-    # Find task and verify access
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+@api_router.post("/tasks/bulk", response_model=BulkTaskResponse, dependencies=[rate_limited("writes")])
+async def bulk_task_operations(request: BulkTaskRequest, current_user: User = Depends(get_current_user),
+                               access: AccessResolver = Depends(get_access_resolver)):
+    """Create, move, reassign or delete many tasks with one access pass and one bulk_write"""
+    operations = request.operations
+    if len(operations) > BULK_TASK_OPERATIONS_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_TASK_OPERATIONS_LIMIT} operations per request")
     
-    # Verify project access
-    project = await db.projects.find_one({"id": task["project_id"], "owner_id": current_user.id})
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    results = [None] * len(operations)
+    
+    def fail(index, status_code, detail):
+        op = operations[index]
+        results[index] = BulkTaskResult(index=index, op=op.op, task_id=op.task_id, success=False,
+                                        status_code=status_code, detail=detail)
+    
+    # Load every referenced task with one query
+    task_ids = [op.task_id for op in operations if op.op != "create" and op.task_id]
+    tasks = {}
+    if task_ids:
+        for task in await db.tasks.find({"id": {"$in": task_ids}}).to_list(len(task_ids)):
+            tasks[task["id"]] = task
+            access.remember_task(task)
+    
+    # Resolve access once per distinct project
+    project_ids = {task["project_id"] for task in tasks.values()}
+    project_ids.update(op.task.project_id for op in operations if op.op == "create" and op.task)
+    await access.preload_projects(project_ids)
+    can_view = {}
+    can_manage = {}
+    for project_id in project_ids:
+        can_view[project_id] = await access.can(PROJECT_VIEW, project_id)
+        can_manage[project_id] = await access.can(PROJECT_MANAGE, project_id)
+    
+    writes = []
+    write_indexes = []  # bulk_write position -> operation index
+    seen_task_ids = set()
+    for index, op in enumerate(operations):
+        if op.op == "create":
+            if op.task is None:
+                fail(index, 400, "Missing task for create")
+            elif current_user.role != "Manager":
+                fail(index, 403, "Only team managers can create tasks")
+            elif not can_view[op.task.project_id]:
+                fail(index, 404, "Project not found or access denied")
+            else:
+                task_obj = Task(created_by=current_user.id, **op.task.dict())
+                writes.append(InsertOne(task_document(task_obj)))
+                write_indexes.append(index)
+                results[index] = task_obj.dict()
+            continue
+        
+        if op.op not in ("update_status", "reassign", "delete"):
+            fail(index, 400, f"Unknown operation: {op.op}")
+            continue
+        if not op.task_id:
+            fail(index, 400, "Missing task_id")
+            continue
+        if op.task_id in seen_task_ids:
+            fail(index, 400, "Task appears more than once in this request")
+            continue
+        seen_task_ids.add(op.task_id)
+        task = tasks.get(op.task_id)
+        if not task:
+            fail(index, 404, "Task not found")
+            continue
+        if not can_manage[task["project_id"]]:
+            fail(index, 404, "Project not found")
+            continue
+        
+        task_filter = {"id": op.task_id, "project_id": task["project_id"]}
+        if op.op == "update_status":
+            if not op.status:
+                fail(index, 400, "Missing status")
+                continue
+            writes.append(UpdateOne(task_filter, {"$set": {"status": op.status}, "$inc": {"version": 1}}))
+        elif op.op == "reassign":
+            writes.append(UpdateOne(task_filter, {"$set": {"assigned_to": op.assigned_to}, "$inc": {"version": 1}}))
+        else:
+            writes.append(DeleteOne(task_filter))
+        write_indexes.append(index)
+    
+    failed_writes = {}
+    if writes:
+        try:
+            await db.tasks.bulk_write(writes, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed_writes[write_indexes[error["index"]]] = error.get("errmsg", "Write failed")
+        
+        written_projects = {
+            operations[index].task.project_id if operations[index].op == "create" else tasks[operations[index].task_id]["project_id"]
+            for index in write_indexes
+        }
+        await bump_versions("tasks", *(f"tasks:{project_id}" for project_id in written_projects))
+    
+    # Build per-item results and collect notifications for one insert_many
+    notifications = []
+    assignees = {op.assigned_to for op in operations if op.op == "reassign" and op.assigned_to}
+    assignees.update(op.task.assigned_to for op in operations if op.op == "create" and op.task and op.task.assigned_to)
+    users = await user_loader.load_many(assignees)
+    existing_users = {user_id for user_id, user in users.items() if user is not None}
+    
+    for index in write_indexes:
+        op = operations[index]
+        if index in failed_writes:
+            fail(index, 500, failed_writes[index])
+            continue
+        
+        if op.op == "create":
+            task = results[index]
+            if task["assigned_to"] in existing_users and task["assigned_to"] != current_user.id:
+                notifications.append(Notification(
+                    user_id=task["assigned_to"],
+                    title="Task Assigned",
+                    message=f"You have been assigned to task: {task['title']}",
+                    type="task_assignment",
+                    task_id=task["id"],
+                    project_id=task["project_id"]
+                ).dict())
+            access.remember_task(task)
+            results[index] = BulkTaskResult(index=index, op=op.op, task_id=task["id"], success=True, status_code=200)
+            continue
+        
+        task = tasks[op.task_id]
+        if op.op == "update_status" and task["status"] != op.status:
+            message = f"Task '{task['title']}' status changed from {task['status']} to {op.status}"
+            recipients = []
+            if task["created_by"] != current_user.id:
+                recipients.append(task["created_by"])
+            if task.get("assigned_to") and task["assigned_to"] not in (current_user.id, task["created_by"]):
+                recipients.append(task["assigned_to"])
+            for user_id in recipients:
+                notifications.append(Notification(
+                    user_id=user_id,
+                    title="Task Status Updated",
+                    message=message,
+                    type="status_change",
+                    task_id=task["id"],
+                    project_id=task["project_id"]
+                ).dict())
+        elif op.op == "reassign" and op.assigned_to in existing_users and op.assigned_to != current_user.id \
+                and op.assigned_to != task.get("assigned_to"):
+            notifications.append(Notification(
+                user_id=op.assigned_to,
+                title="Task Assigned",
+                message=f"You have been assigned to task: {task['title']}",
+                type="task_assignment",
+                task_id=task["id"],
+                project_id=task["project_id"]
+            ).dict())
+        elif op.op == "delete":
+            project_access_cache.forget_task(op.task_id)
+        results[index] = BulkTaskResult(index=index, op=op.op, task_id=op.task_id, success=True, status_code=200)
+    
+    if notifications:
+        await db.notifications.insert_many(notifications)
+        await bump_versions(*(f"notifications:{notification['user_id']}" for notification in notifications))
+    
+    succeeded = sum(1 for result in results if result.success)
+    return BulkTaskResponse(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+@api_router.delete("/tasks/{task_id}", dependencies=[rate_limited("writes")])
+async def delete_task(task_id: str, current_user: User = Depends(get_current_user),
+                      access: AccessResolver = Depends(get_access_resolver)):
+    # Verify task exists and project access
+    project_id = await access.require_task(task_id, PROJECT_MANAGE, detail="Project not found")
     
     # Delete task
     result = await db.tasks.delete_one({"id": task_id})
+    project_access_cache.forget_task(task_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Task not found")
+    await bump_versions("tasks", f"tasks:{project_id}")
     
     return {"message": "Task deleted successfully"}
 
@@ -466,12 +2163,20 @@ async def delete_task(task_id: str, current_user: User = Depends(get_current_use
 async def create_notification(notification: NotificationCreate, current_user: User = Depends(get_current_user)):
     notification_obj = Notification(**notification.dict())
     await db.notifications.insert_one(notification_obj.dict())
+    await bump_versions(f"notifications:{notification_obj.user_id}")
     return notification_obj
 
 @api_router.get("/notifications", response_model=List[Notification])
-async def get_notifications(current_user: User = Depends(get_current_user)):
-    notifications = await db.notifications.find({"user_id": current_user.id}).sort("created_at", -1).to_list(100)
-    return [Notification(**notification) for notification in notifications]
+async def get_notifications(request: Request, current_user: User = Depends(get_current_user)):
+    etag = await list_etag(request, current_user.id, f"notifications:{current_user.id}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    notifications = await db.notifications.find(visible_notifications_query(current_user.id)).sort("created_at", -1).to_list(100)
+    return notification_list_serializer.response(
+        [render_notification(notification) for notification in notifications],
+        headers={"ETag": etag}
+    )
 
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, current_user: User = Depends(get_current_user)):
@@ -481,31 +2186,28 @@ async def mark_notification_read(notification_id: str, current_user: User = Depe
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Notification not found")
+    await bump_versions(f"notifications:{current_user.id}")
     return {"message": "Notification marked as read"}
 
 @api_router.get("/notifications/unread-count")
 async def get_unread_notification_count(current_user: User = Depends(get_current_user)):
-    count = await db.notifications.count_documents({"user_id": current_user.id, "read": False})
+    query = visible_notifications_query(current_user.id)
+    query["read"] = False
+    count = await db.notifications.count_documents(query)
     return {"count": count}
 
 # File Attachment Routes
-@api_router.post("/files", response_model=FileAttachment)
-async def upload_file(file: FileUpload, current_user: User = Depends(get_current_user)):
+@api_router.post("/files", response_model=FileAttachment, dependencies=[rate_limited("files")])
+async def upload_file(file: FileUpload, current_user: User = Depends(get_current_user),
+                      access: AccessResolver = Depends(get_access_resolver)):
     # Verify task exists and user has access
     task = await db.tasks.find_one({"id": file.task_id})
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     # Check if user has access to project (owner OR team member)
-    project = await db.projects.find_one({
-        "id": task["project_id"],
-        "$or": [
-            {"owner_id": current_user.id},  # Project owner
-            {"team_members": current_user.id}  # Team member
-        ]
-    })
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found or access denied")
+    access.remember_task(task)
+    await access.require_project(task["project_id"])
     
     # Calculate file size from base64 data
     import base64
@@ -530,54 +2232,42 @@ async def upload_file(file: FileUpload, current_user: User = Depends(get_current
     await db.file_attachments.insert_one(file_obj.dict())
     
     # Create notification for task owner/assignee
-    task_owner = await db.users.find_one({"id": task["created_by"]})
+    task_owner = await user_loader.load(task["created_by"])
     if task_owner and task_owner["id"] != current_user.id:
-        notification = Notification(
+        await push_notification(
             user_id=task_owner["id"],
             title="File Uploaded",
             message=f"{current_user.name} uploaded a file to task: {task['title']}",
             type="file_upload",
             task_id=file.task_id,
-            project_id=task["project_id"]
+            project_id=task["project_id"],
+            subject=task["title"]
         )
-        await db.notifications.insert_one(notification.dict())
     
     return file_obj
 
 @api_router.get("/files", response_model=List[FileAttachment])
-async def get_files(task_id: str, current_user: User = Depends(get_current_user)):
-    # Verify task access
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    # Check if user has access to project (owner OR team member)
-    project = await db.projects.find_one({
-        "id": task["project_id"],
-        "$or": [
-            {"owner_id": current_user.id},  # Project owner
-            {"team_members": current_user.id}  # Team member
-        ]
-    })
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found or access denied")
+async def get_files(task_id: str, current_user: User = Depends(get_current_user),
+                    access: AccessResolver = Depends(get_access_resolver)):
+    # Verify task access (owner OR team member)
+    await access.require_task(task_id)
     
     files = await db.file_attachments.find({"task_id": task_id}).sort("uploaded_at", -1).to_list(100)
-    return [FileAttachment(**file) for file in files]
+    return file_list_serializer.response(files)
 
 @api_router.delete("/files/{file_id}")
-async def delete_file(file_id: str, current_user: User = Depends(get_current_user)):
-    file_doc = await db.file_attachments.find_one({"id": file_id})
+async def delete_file(file_id: str, current_user: User = Depends(get_current_user),
+                      access: AccessResolver = Depends(get_access_resolver)):
+    file_doc = await db.file_attachments.find_one({"id": file_id}, {"_id": 0, "task_id": 1, "uploaded_by": 1})
     if not file_doc:
         raise HTTPException(status_code=404, detail="File not found")
     
     # Verify access through task
-    task = await db.tasks.find_one({"id": file_doc["task_id"]})
-    if not task:
+    project_id = await access.task_project(file_doc["task_id"])
+    if project_id is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    project = await db.projects.find_one({"id": task["project_id"], "owner_id": current_user.id})
-    if not project and file_doc["uploaded_by"] != current_user.id:
+    if file_doc["uploaded_by"] != current_user.id and not await access.can(PROJECT_MANAGE, project_id):
         raise HTTPException(status_code=403, detail="Permission denied")
     
     result = await db.file_attachments.delete_one({"id": file_id})
@@ -587,23 +2277,17 @@ async def delete_file(file_id: str, current_user: User = Depends(get_current_use
     return {"message": "File deleted successfully"}
 
 # Comment Routes
-@api_router.post("/comments", response_model=Comment)
-async def create_comment(comment: CommentCreate, current_user: User = Depends(get_current_user)):
+@api_router.post("/comments", response_model=Comment, dependencies=[rate_limited("comments")])
+async def create_comment(comment: CommentCreate, current_user: User = Depends(get_current_user),
+                         access: AccessResolver = Depends(get_access_resolver)):
     # Verify task access
     task = await db.tasks.find_one({"id": comment.task_id})
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     # Check if user has access to project (owner OR team member)
-    project = await db.projects.find_one({
-        "id": task["project_id"],
-        "$or": [
-            {"owner_id": current_user.id},  # Project owner
-            {"team_members": current_user.id}  # Team member
-        ]
-    })
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found or access denied")
+    access.remember_task(task)
+    await access.require_project(task["project_id"])
     
     comment_obj = Comment(
         task_id=comment.task_id,
@@ -612,56 +2296,57 @@ async def create_comment(comment: CommentCreate, current_user: User = Depends(ge
         content=comment.content,
         parent_id=comment.parent_id
     )
-    await db.comments.insert_one(comment_obj.dict())
+    # project_id is stored (not returned) so search can filter comments by accessible project
+    await db.comments.insert_one({**comment_obj.dict(), "project_id": task["project_id"]})
+    await bump_versions(f"comments:{comment.task_id}")
     
     # Create notification for task owner/assignee
-    task_owner = await db.users.find_one({"id": task["created_by"]})
+    task_owner = await user_loader.load(task["created_by"])
     if task_owner and task_owner["id"] != current_user.id:
-        notification = Notification(
+        await push_notification(
             user_id=task_owner["id"],
             title="New Comment",
             message=f"{current_user.name} commented on task: {task['title']}",
             type="comment",
             task_id=comment.task_id,
-            project_id=task["project_id"]
+            project_id=task["project_id"],
+            subject=task["title"]
         )
-        await db.notifications.insert_one(notification.dict())
     
     return comment_obj
 
 @api_router.get("/comments", response_model=List[Comment])
-async def get_comments(task_id: str, current_user: User = Depends(get_current_user)):
-    # Verify task access
-    task = await db.tasks.find_one({"id": task_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+async def get_comments(request: Request, task_id: str, stream: bool = False,
+                       current_user: User = Depends(get_current_user),
+                       access: AccessResolver = Depends(get_access_resolver)):
+    # Verify task access (owner OR team member)
+    await access.require_task(task_id)
     
-    # Check if user has access to project (owner OR team member)
-    project = await db.projects.find_one({
-        "id": task["project_id"],
-        "$or": [
-            {"owner_id": current_user.id},  # Project owner
-            {"team_members": current_user.id}  # Team member
-        ]
-    })
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found or access denied")
+    etag = await list_etag(request, current_user.id, f"comments:{task_id}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
     
-    comments = await db.comments.find({"task_id": task_id}).sort("created_at", 1).to_list(1000)
-    return [Comment(**comment) for comment in comments]
+    cursor = db.comments.find({"task_id": task_id}).sort("created_at", 1)
+    if stream or wants_ndjson(request):
+        return comment_list_serializer.stream(cursor, ndjson=wants_ndjson(request), headers={"ETag": etag})
+    comments = await cursor.to_list(1000)
+    return comment_list_serializer.response(comments, headers={"ETag": etag})
 
-@api_router.put("/comments/{comment_id}", response_model=Comment)
-async def update_comment(comment_id: str, comment_update: CommentUpdate, current_user: User = Depends(get_current_user)):
-    comment = await db.comments.find_one({"id": comment_id, "user_id": current_user.id})
-    if not comment:
-        raise HTTPException(status_code=404, detail="Comment not found or not owned by user")
-    
-    result = await db.comments.update_one(
-        {"id": comment_id},
-        {"$set": {"content": comment_update.content, "updated_at": datetime.utcnow()}}
+@api_router.put("/comments/{comment_id}", response_model=Comment, dependencies=[rate_limited("comments")])
+async def update_comment(comment_id: str, comment_update: CommentUpdate, response: Response,
+                         if_match: Optional[str] = Header(None),
+                         current_user: User = Depends(get_current_user)):
+    owner_filter = {"id": comment_id, "user_id": current_user.id}
+    updated_comment = await db.comments.find_one_and_update(
+        {**owner_filter, **version_filter(parse_if_match(if_match))},
+        {"$set": {"content": comment_update.content, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
     )
+    if not updated_comment:
+        await raise_write_miss(db.comments, owner_filter, "Comment not found or not owned by user")
+    await bump_versions(f"comments:{updated_comment['task_id']}")
     
-    updated_comment = await db.comments.find_one({"id": comment_id})
+    set_version_etag(response, updated_comment)
     return Comment(**updated_comment)
 
 @api_router.delete("/comments/{comment_id}")
@@ -673,17 +2358,93 @@ async def delete_comment(comment_id: str, current_user: User = Depends(get_curre
     result = await db.comments.delete_one({"id": comment_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Comment not found")
+    await bump_versions(f"comments:{comment['task_id']}")
     
     return {"message": "Comment deleted successfully"}
 
+# Search Routes
+@api_router.get("/search")
+async def search(q: str, page: int = 1, limit: int = 20, current_user: User = Depends(get_current_user)):
+    """Ranked full-text search over task titles/descriptions and comments the caller can see.
+    
+    Visibility matches get_tasks: tasks in projects the user owns or belongs to, plus tasks assigned to them.
+    """
+    page = max(page, 1)
+    limit = min(max(limit, 1), SEARCH_PAGE_SIZE_LIMIT)
+    window = page * limit
+    if window > SEARCH_MAX_WINDOW:
+        raise HTTPException(status_code=400, detail=f"Search results are limited to the first {SEARCH_MAX_WINDOW} hits")
+    if not q.strip():
+        return {"query": q, "page": page, "limit": limit, "has_more": False, "results": []}
+    
+    accessible_projects = await find_accessible_projects(current_user.id, {"_id": 0, "id": 1})
+    project_ids = [p["id"] for p in accessible_projects]
+    assigned_task_ids = await db.tasks.distinct("id", {"assigned_to": current_user.id})
+    
+    # Each collection's own top (window + 1) hits are enough to fill this page of the merged ranking
+    score = {"score": {"$meta": "textScore"}}
+    tasks, comments = await asyncio.gather(
+        db.tasks.find(
+            {"$text": {"$search": q}, "$or": [{"project_id": {"$in": project_ids}}, {"assigned_to": current_user.id}]},
+            {"_id": 0, "id": 1, "project_id": 1, "title": 1, "description": 1, **score}
+        ).sort([("score", {"$meta": "textScore"})]).limit(window + 1).to_list(window + 1),
+        db.comments.find(
+            {"$text": {"$search": q}, "$or": [{"project_id": {"$in": project_ids}}, {"task_id": {"$in": assigned_task_ids}}]},
+            {"_id": 0, "id": 1, "task_id": 1, "content": 1, **score}
+        ).sort([("score", {"$meta": "textScore"})]).limit(window + 1).to_list(window + 1)
+    )
+    
+    hits = [("task", task) for task in tasks] + [("comment", comment) for comment in comments]
+    hits.sort(key=lambda hit: hit[1]["score"], reverse=True)
+    page_hits = hits[window - limit:window]
+    
+    # Titles for comment hits; comments whose task was deleted are dropped
+    comment_task_ids = list({hit["task_id"] for kind, hit in page_hits if kind == "comment"})
+    comment_tasks = {
+        task["id"]: task for task in await db.tasks.find(
+            {"id": {"$in": comment_task_ids}}, {"_id": 0, "id": 1, "project_id": 1, "title": 1}
+        ).to_list(None)
+    } if comment_task_ids else {}
+    
+    pattern = search_highlight_pattern(q)
+    results = []
+    for kind, hit in page_hits:
+        if kind == "task":
+            title_match = pattern is not None and pattern.search(hit["title"]) is not None
+            field = "title" if title_match or not hit.get("description") else "description"
+            results.append({
+                "type": "task", "id": hit["id"], "task_id": hit["id"], "project_id": hit["project_id"],
+                "title": hit["title"], "field": field, "score": round(hit["score"], 4),
+                **search_snippet(hit[field], pattern)
+            })
+        else:
+            task = comment_tasks.get(hit["task_id"])
+            if task is None:
+                continue
+            results.append({
+                "type": "comment", "id": hit["id"], "task_id": hit["task_id"], "project_id": task["project_id"],
+                "title": task["title"], "field": "content", "score": round(hit["score"], 4),
+                **search_snippet(hit["content"], pattern)
+            })
+    
+    return {"query": q, "page": page, "limit": limit, "has_more": len(hits) > window, "results": results}
+
 # Progress Analytics Routes
-@api_router.get("/analytics/progress", response_model=List[ProjectProgress])
-async def get_progress_analytics(current_user: User = Depends(get_current_user)):
-    projects = await db.projects.find({"owner_id": current_user.id}).to_list(1000)
+async def compute_progress_analytics(user_id: str) -> List[ProjectProgress]:
+    projects = await db.projects.find({"owner_id": user_id}).to_list(1000)
     result = []
     
+    # One query for every project's tasks rather than one per project
+    tasks_by_project = {project["id"]: [] for project in projects}
+    all_tasks = db.tasks.find(
+        {"project_id": {"$in": list(tasks_by_project)}},
+        {"_id": 0, "project_id": 1, "status": 1, "due_date": 1}
+    )
+    async for task in all_tasks:
+        tasks_by_project[task["project_id"]].append(task)
+    
     for project in projects:
-        tasks = await db.tasks.find({"project_id": project["id"]}).to_list(1000)
+        tasks = tasks_by_project[project["id"]]
         
         total_tasks = len(tasks)
         completed_tasks = len([t for t in tasks if t["status"] == "Done"])
@@ -718,10 +2479,9 @@ async def get_progress_analytics(current_user: User = Depends(get_current_user))
     
     return result
 
-@api_router.get("/analytics/overview")
-async def get_analytics_overview(current_user: User = Depends(get_current_user)):
+async def compute_analytics_overview(user_id: str) -> dict:
     # Get all user's projects
-    projects = await db.projects.find({"owner_id": current_user.id}).to_list(1000)
+    projects = await db.projects.find({"owner_id": user_id}).to_list(1000)
     project_ids = [p["id"] for p in projects]
     
     # Get all tasks for user's projects
@@ -780,6 +2540,24 @@ async def get_analytics_overview(current_user: User = Depends(get_current_user))
         }
     }
 
+async def analytics_flight_key(name: str, user_id: str) -> tuple:
+    """Single-flight key for a user's analytics, including the versions of the data they are computed from.
+    
+    As with the task list, a request made after a write must not join a computation that started before it.
+    """
+    versions = await probe_versions("tasks", "projects")
+    return (name, user_id, tuple(versions.items()))
+
+@api_router.get("/analytics/progress", response_model=List[ProjectProgress])
+async def get_progress_analytics(current_user: User = Depends(get_current_user)):
+    return await single_flight.do(await analytics_flight_key("analytics.progress", current_user.id),
+                                  lambda: compute_progress_analytics(current_user.id))
+
+@api_router.get("/analytics/overview")
+async def get_analytics_overview(current_user: User = Depends(get_current_user)):
+    return await single_flight.do(await analytics_flight_key("analytics.overview", current_user.id),
+                                  lambda: compute_analytics_overview(current_user.id))
+
 # Helper function to create due date notifications
 async def create_due_date_notifications():
     """Background task to create notifications for upcoming due dates"""
@@ -802,7 +2580,7 @@ async def create_due_date_notifications():
         })
         
         if not existing_notification:
-            notification = Notification(
+            await push_notification(
                 user_id=task["created_by"],
                 title="Task Due Tomorrow",
                 message=f"Task '{task['title']}' is due tomorrow",
@@ -810,11 +2588,846 @@ async def create_due_date_notifications():
                 task_id=task["id"],
                 project_id=task["project_id"]
             )
-            await db.notifications.insert_one(notification.dict())
+
+async def release_notification_digests():
+    """Background loop that periodically delivers pending notification aggregates in one write"""
+    while True:
+        await asyncio.sleep(NOTIFICATION_DIGEST_INTERVAL_SECONDS)
+        try:
+            # Stamp what this pass releases, so exactly those recipients get their lists bumped;
+            # an aggregate upserted meanwhile waits for the next pass instead of going out unannounced
+            release_id = str(uuid.uuid4())
+            await db.notifications.update_many(
+                {"pending_digest": True},
+                {"$unset": {"pending_digest": ""}, "$set": {"created_at": datetime.utcnow(), "digest_release": release_id}}
+            )
+            user_ids = await db.notifications.distinct("user_id", {"digest_release": release_id})
+            await bump_versions(*(f"notifications:{user_id}" for user_id in user_ids))
+        except Exception:
+            logger.exception("Failed to release notification digests")
+
+async def ensure_indexes():
+    """Create the indexes the hot query paths rely on"""
+    # Coalescing lookup and the bell list/unread count
+    await db.notifications.create_index([("user_id", 1), ("type", 1), ("task_id", 1), ("read", 1)])
+    await db.notifications.create_index([("user_id", 1), ("created_at", -1)])
+    await db.notifications.create_index("digest_release", sparse=True)
+    
+    # Board filters and sorts (equality, then sort, then range); single-field project_id is a prefix of these
+    await db.tasks.create_index([("project_id", 1), ("status", 1), ("due_date", 1)])
+    await db.tasks.create_index([("project_id", 1), ("assigned_to", 1), ("status", 1), ("due_date", 1)])
+    await db.tasks.create_index([("project_id", 1), ("due_date", 1)])
+    await db.tasks.create_index([("project_id", 1), ("created_by", 1), ("created_at", -1)])
+    await db.tasks.create_index([("project_id", 1), ("created_at", -1)])
+    await db.tasks.create_index([("project_id", 1), ("title_lower", 1)])
+    await db.tasks.create_index([("assigned_to", 1), ("status", 1), ("due_date", 1)])
+    await db.tasks.create_index([("created_by", 1), ("created_at", -1)])
+    
+    # Full-text search; titles outweigh descriptions
+    await db.tasks.create_index([("title", "text"), ("description", "text")],
+                                weights={"title": 5, "description": 1}, name="tasks_text")
+    await db.comments.create_index([("content", "text")], name="comments_text")
+    
+    # Prefix search over normalized user names and emails
+    await db.users.create_index("search_name")
+    await db.users.create_index([("name_terms", 1), ("search_name", 1)])
+    await db.users.create_index([("search_terms", 1), ("search_name", 1)])
+    
+    # Project lookups by id, owner and team member
+    await db.projects.create_index("id")
+    await db.projects.create_index("owner_id")
+    await db.projects.create_index("team_members")
+    
+    await db.project_memberships.create_index([("project_id", 1), ("user_id", 1)], unique=True)
+    await db.project_memberships.create_index([("user_id", 1), ("project_id", 1)])
+    
+    # Refresh tokens: expired ones are TTL-deleted; families and users are revoked together
+    await db.refresh_tokens.create_index("expires_at", expireAfterSeconds=0)
+    await db.refresh_tokens.create_index("family_id")
+    await db.refresh_tokens.create_index("user_id")
+    
+    if RATE_LIMIT_STORE == "mongo":
+        await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+    
+    # Slow query log keeps only the most recent entries
+    if SLOW_QUERY_THRESHOLD_MS > 0 and "slow_queries" not in await db.list_collection_names():
+        try:
+            await db.create_collection("slow_queries", capped=True, size=SLOW_QUERY_LOG_SIZE_BYTES)
+        except CollectionInvalid:
+            pass  # Created concurrently by another worker
+
+# Response compression
+# Server preference when the client accepts several encodings equally
+SUPPORTED_ENCODINGS = [
+    encoding for encoding, module in (("zstd", zstandard), ("br", brotli), ("gzip", zlib)) if module is not None
+]
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    offered = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[coding.strip().lower()] = q
+    
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = offered.get(encoding, offered.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSION_CONTENT_TYPES)
+
+def route_template(scope) -> str:
+    """Path template of the matched route (e.g. /api/tasks/{task_id}/status), for per-route metrics"""
+    route = scope.get("route")
+    return route.path if route is not None else "unmatched"
+
+class StreamCompressor:
+    """Incremental compressor with one interface over gzip, brotli and zstd"""
+    
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compress a chunk; non-final chunks are flushed so streamed output reaches the client promptly"""
+        if self.encoding == "gzip":
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.process(data) + (self._compressor.finish() if final else self._compressor.flush())
+        flush_mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return self._compressor.compress(data) + self._compressor.flush(flush_mode)
+
+class CompressionStats:
+    """Per-route totals for compressed responses"""
+    
+    def __init__(self):
+        self.routes = {}  # route template -> [responses, bytes in, bytes out, cpu seconds]
+    
+    def record(self, route: str, bytes_in: int, bytes_out: int, cpu_seconds: float):
+        totals = self.routes.get(route)
+        if totals is None:
+            totals = self.routes[route] = [0, 0, 0, 0.0]
+        totals[0] += 1
+        totals[1] += bytes_in
+        totals[2] += bytes_out
+        totals[3] += cpu_seconds
+    
+    def summary(self) -> List[dict]:
+        return [
+            {
+                "route": route,
+                "responses": responses,
+                "bytes_in": bytes_in,
+                "bytes_out": bytes_out,
+                "compression_ratio": round(bytes_in / bytes_out, 2) if bytes_out else None,
+                "cpu_ms_total": round(cpu_seconds * 1000, 3),
+                "cpu_ms_per_response": round(cpu_seconds * 1000 / responses, 3)
+            }
+            for route, (responses, bytes_in, bytes_out, cpu_seconds) in sorted(self.routes.items())
+        ]
+
+compression_stats = CompressionStats()
+
+class CompressionMiddleware:
+    """Compress response bodies with the best encoding the client accepts (zstd, br or gzip).
+    
+    Bodies under minimum_size and content types outside COMPRESSION_CONTENT_TYPES pass through
+    untouched. Streaming responses are compressed chunk by chunk.
+    """
+    
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = choose_encoding(value.decode("latin-1"))
+                break
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        compressor = None
+        passthrough = False
+        bytes_in = bytes_out = 0
+        cpu_seconds = 0.0
+        
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough, bytes_in, bytes_out, cpu_seconds
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if ("content-encoding" in headers or not is_compressible(headers.get("content-type"))
+                        or (not more_body and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                
+                compressor = StreamCompressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    started = time.thread_time()
+                    compressed = compressor.compress(body, final=True)
+                    cpu_seconds += time.thread_time() - started
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    compression_stats.record(route_template(scope), len(body), len(compressed), cpu_seconds)
+                    return
+                await send(start_message)
+            
+            started = time.thread_time()
+            compressed = compressor.compress(body, final=not more_body)
+            cpu_seconds += time.thread_time() - started
+            bytes_in += len(body)
+            bytes_out += len(compressed)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            if not more_body:
+                compression_stats.record(route_template(scope), bytes_in, bytes_out, cpu_seconds)
+        
+        await self.app(scope, receive, send_compressed)
+
+# Request metrics
+class RouteMetrics:
+    """Counters for one method and route template.
+    
+    Only ever touched from the event loop thread, so plain attribute updates are safe without locks;
+    the histogram buckets are allocated once, when the route is first seen.
+    """
+    
+    __slots__ = ("in_flight", "bucket_counts", "latency_sum", "requests", "statuses", "response_bytes", "db_commands",
+                 "query_budget_violations", "deadline_exceeded", "client_disconnects")
+    
+    def __init__(self):
+        self.in_flight = 0
+        self.bucket_counts = [0] * (len(METRICS_LATENCY_BUCKETS) + 1)  # Last slot is +Inf
+        self.latency_sum = 0.0
+        self.requests = 0
+        self.statuses = {}  # status code -> responses
+        self.response_bytes = 0
+        self.db_commands = {}  # (collection, command name) -> [commands, seconds, documents]
+        self.query_budget_violations = 0
+        self.deadline_exceeded = 0
+        self.client_disconnects = 0
+    
+    def observe(self, seconds: float, status_code: int, response_bytes: int):
+        self.bucket_counts[bisect_left(METRICS_LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sum += seconds
+        self.requests += 1
+        self.statuses[status_code] = self.statuses.get(status_code, 0) + 1
+        self.response_bytes += response_bytes
+    
+    def observe_db(self, stats: RequestDbStats):
+        for collection, command_name, seconds, documents in stats.commands:
+            totals = self.db_commands.get((collection, command_name))
+            if totals is None:
+                totals = self.db_commands[(collection, command_name)] = [0, 0.0, 0]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += documents
+
+def prometheus_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{prometheus_label_value(value)}"' for name, value in labels.items()) + "}"
+
+class HttpMetrics:
+    """Per-route request metrics, rendered in the Prometheus text exposition format"""
+    
+    def __init__(self):
+        self.routes = {}  # (method, route template) -> RouteMetrics
+        self.in_flight = 0
+    
+    def route(self, method: str, template: str) -> RouteMetrics:
+        key = (method, template)
+        metrics = self.routes.get(key)
+        if metrics is None:
+            metrics = self.routes[key] = RouteMetrics()
+        return metrics
+    
+    def render(self) -> str:
+        routes = sorted(self.routes.items())
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being handled",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_route_requests_in_flight Requests currently being handled, per API route",
+            "# TYPE http_route_requests_in_flight gauge",
+        ]
+        for (method, template), metrics in routes:
+            lines.append(f"http_route_requests_in_flight{prometheus_labels(method=method, route=template)} {metrics.in_flight}")
+        
+        lines += [
+            "# HELP http_request_duration_seconds Time from receiving a request to sending the last response byte",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, template), metrics in routes:
+            cumulative = 0
+            for bound, count in zip(METRICS_LATENCY_BUCKETS + ("+Inf",), metrics.bucket_counts):
+                cumulative += count
+                lines.append(f"http_request_duration_seconds_bucket{prometheus_labels(method=method, route=template, le=bound)} {cumulative}")
+            labels = prometheus_labels(method=method, route=template)
+            lines.append(f"http_request_duration_seconds_sum{labels} {metrics.latency_sum}")
+            lines.append(f"http_request_duration_seconds_count{labels} {metrics.requests}")
+        
+        lines += [
+            "# HELP http_responses_total Responses sent, by status code",
+            "# TYPE http_responses_total counter",
+        ]
+        for (method, template), metrics in routes:
+            for status_code, count in sorted(metrics.statuses.items()):
+                lines.append(f"http_responses_total{prometheus_labels(method=method, route=template, status=status_code)} {count}")
+        
+        lines += [
+            "# HELP http_response_size_bytes Response body bytes sent, after compression",
+            "# TYPE http_response_size_bytes summary",
+        ]
+        for (method, template), metrics in routes:
+            labels = prometheus_labels(method=method, route=template)
+            lines.append(f"http_response_size_bytes_sum{labels} {metrics.response_bytes}")
+            lines.append(f"http_response_size_bytes_count{labels} {metrics.requests}")
+        
+        db_series = [
+            (prometheus_labels(method=method, route=template, collection=collection, command=command_name), totals)
+            for (method, template), metrics in routes
+            for (collection, command_name), totals in sorted(metrics.db_commands.items())
+        ]
+        lines += [
+            "# HELP http_route_db_commands_total MongoDB commands issued while handling requests",
+            "# TYPE http_route_db_commands_total counter",
+        ]
+        lines += [f"http_route_db_commands_total{labels} {totals[0]}" for labels, totals in db_series]
+        lines += [
+            "# HELP http_route_db_duration_seconds_total Time spent in MongoDB commands while handling requests",
+            "# TYPE http_route_db_duration_seconds_total counter",
+        ]
+        lines += [f"http_route_db_duration_seconds_total{labels} {totals[1]}" for labels, totals in db_series]
+        lines += [
+            "# HELP http_route_db_documents_total Documents returned or written by MongoDB commands",
+            "# TYPE http_route_db_documents_total counter",
+        ]
+        lines += [f"http_route_db_documents_total{labels} {totals[2]}" for labels, totals in db_series]
+        
+        lines += [
+            "# HELP http_route_query_budget_violations_total Requests that exceeded their DB call budget or repeated a query shape",
+            "# TYPE http_route_query_budget_violations_total counter",
+        ]
+        for (method, template), metrics in routes:
+            if metrics.query_budget_violations:
+                lines.append(f"http_route_query_budget_violations_total{prometheus_labels(method=method, route=template)} {metrics.query_budget_violations}")
+        
+        lines += [
+            "# HELP http_route_deadline_exceeded_total Requests aborted with a 504 after running past their deadline",
+            "# TYPE http_route_deadline_exceeded_total counter",
+        ]
+        for (method, template), metrics in routes:
+            if metrics.deadline_exceeded:
+                lines.append(f"http_route_deadline_exceeded_total{prometheus_labels(method=method, route=template)} {metrics.deadline_exceeded}")
+        lines += [
+            "# HELP http_route_client_disconnects_total Requests cancelled because the client went away",
+            "# TYPE http_route_client_disconnects_total counter",
+        ]
+        for (method, template), metrics in routes:
+            if metrics.client_disconnects:
+                lines.append(f"http_route_client_disconnects_total{prometheus_labels(method=method, route=template)} {metrics.client_disconnects}")
+        return "\n".join(lines) + "\n"
+
+http_metrics = HttpMetrics()
+
+def query_budget_violations(method: str, template: str, stats: RequestDbStats) -> List[str]:
+    """Ways a request broke its query budget: too many DB calls, or one query shape repeated (N+1)"""
+    problems = []
+    budget = QUERY_BUDGET_OVERRIDES.get(f"{method} {template}", QUERY_BUDGET_DEFAULT)
+    if stats.count > budget:
+        problems.append(f"{stats.count} db calls, budget is {budget}")
+    repeats = {}
+    for shape in stats.shapes:
+        repeats[shape] = repeats.get(shape, 0) + 1
+    for shape, count in repeats.items():
+        if count > QUERY_REPEAT_LIMIT:
+            problems.append(f"{count}x {shape}")
+    return problems
+
+class MetricsMiddleware:
+    """Record latency, status code, response size and MongoDB usage for every HTTP request, keyed by route template.
+    
+    Database time spent before the response starts is reported to the client in a Server-Timing header.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        status_code = 500  # Reported if the app fails before starting a response; 499 if the client left first
+        response_bytes = 0
+        db_stats = RequestDbStats(scope)
+        token = request_db_stats.set(db_stats)
+        
+        budget_error = None
+        
+        async def send_with_metrics(message):
+            nonlocal status_code, response_bytes, budget_error
+            if budget_error is not None:
+                return  # The app's response was replaced by the query budget error
+            if message["type"] == "http.response.start":
+                if QUERY_BUDGET_MODE == "raise" and DB_COMMAND_INSTRUMENTATION:
+                    problems = query_budget_violations(scope["method"], route_template(scope), db_stats)
+                    if problems:
+                        budget_error = json.dumps({"detail": "Query budget exceeded: " + "; ".join(problems)}).encode()
+                        status_code = 500
+                        response_bytes = len(budget_error)
+                        await send({"type": "http.response.start", "status": 500, "headers": [
+                            (b"content-type", b"application/json"), (b"content-length", str(len(budget_error)).encode())
+                        ]})
+                        await send({"type": "http.response.body", "body": budget_error})
+                        return
+                status_code = message["status"]
+                if DB_COMMAND_INSTRUMENTATION:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", f'db;dur={db_stats.seconds * 1000:.1f};desc="{db_stats.count} queries"')
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+        
+        http_metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            request_db_stats.reset(token)
+            http_metrics.in_flight -= 1
+            if scope.get("client_disconnected"):
+                status_code = 499
+            elapsed = time.perf_counter() - started
+            template = route_template(scope)
+            metrics = http_metrics.route(scope["method"], template)
+            metrics.observe(elapsed, status_code, response_bytes)
+            if db_stats.commands:
+                metrics.observe_db(db_stats)
+                if QUERY_BUDGET_MODE != "off":
+                    problems = query_budget_violations(scope["method"], template, db_stats)
+                    if problems:
+                        metrics.query_budget_violations += 1
+                        logger.warning("%s %s exceeded its query budget: %s", scope["method"], template, "; ".join(problems))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "%s %s -> %s in %.1f ms; %d db calls, %.1f ms in db (%s)",
+                        scope["method"], template, status_code, elapsed * 1000, db_stats.count, db_stats.seconds * 1000,
+                        ", ".join(f"{command_name} {collection}" for collection, command_name, _, _ in db_stats.commands)
+                    )
+
+# Event loop monitoring
+class EventLoopMonitor:
+    """Measures event loop lag as the overshoot of a short periodic sleep.
+    
+    A watchdog thread watches the sleeper's heartbeat; when the loop stops ticking for longer than
+    the threshold it logs the loop thread's current stack, i.e. the code that is blocking it.
+    """
+    
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = 0.0  # Most recent measurement, in seconds
+        self.bucket_counts = [0] * (len(EVENT_LOOP_LAG_BUCKETS) + 1)
+        self.lag_sum = 0.0
+        self.samples = 0
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._stopped = threading.Event()
+    
+    async def run(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True).start()
+        try:
+            while True:
+                expected = time.perf_counter() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, time.perf_counter() - expected)
+                self._heartbeat = time.monotonic()
+                self.lag = lag
+                self.bucket_counts[bisect_left(EVENT_LOOP_LAG_BUCKETS, lag)] += 1
+                self.lag_sum += lag
+                self.samples += 1
+                if lag > self.threshold:
+                    self.stalls += 1
+        finally:
+            self._stopped.set()
+    
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked > self.threshold and heartbeat != reported:
+                reported = heartbeat  # One stack per stall
+                frame = sys._current_frames().get(self._loop_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame is not None else "(unavailable)\n"
+                logger.warning("Event loop blocked for %.0f ms so far; loop thread is at:\n%s", blocked * 1000, stack)
+    
+    def render(self) -> str:
+        lines = [
+            "# HELP event_loop_lag_seconds Delay between when the loop should have woken a timer and when it did",
+            "# TYPE event_loop_lag_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(EVENT_LOOP_LAG_BUCKETS + ("+Inf",), self.bucket_counts):
+            cumulative += count
+            lines.append(f"event_loop_lag_seconds_bucket{prometheus_labels(le=bound)} {cumulative}")
+        lines += [
+            f"event_loop_lag_seconds_sum {self.lag_sum}",
+            f"event_loop_lag_seconds_count {self.samples}",
+            "# HELP event_loop_lag_current_seconds Most recent event loop lag measurement",
+            "# TYPE event_loop_lag_current_seconds gauge",
+            f"event_loop_lag_current_seconds {self.lag}",
+            "# HELP event_loop_stalls_total Lag measurements over EVENT_LOOP_LAG_THRESHOLD_MS",
+            "# TYPE event_loop_stalls_total counter",
+            f"event_loop_stalls_total {self.stalls}",
+        ]
+        return "\n".join(lines) + "\n"
+
+event_loop_monitor = EventLoopMonitor(EVENT_LOOP_MONITOR_INTERVAL_SECONDS, EVENT_LOOP_LAG_THRESHOLD_MS / 1000)
+
+# Admission control
+PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW = 0, 1, 2
+PRIORITY_NAMES = ("high", "normal", "low")
+# First match wins: (methods or None for any, path prefix, priority)
+ADMISSION_PRIORITY_RULES = [
+    (None, "/api/auth/", PRIORITY_LOW),
+    ({"GET"}, "/api/notifications", PRIORITY_LOW),
+    ({"POST", "PUT", "PATCH", "DELETE"}, "/api/tasks", PRIORITY_HIGH),
+    ({"POST", "PUT", "PATCH", "DELETE"}, "/api/comments", PRIORITY_HIGH),
+    ({"POST", "PUT", "PATCH", "DELETE"}, "/api/files", PRIORITY_HIGH),
+    ({"POST", "PUT", "PATCH", "DELETE"}, "/api/projects", PRIORITY_HIGH),
+]
+
+def request_priority(method: str, path: str) -> int:
+    for methods, prefix, priority in ADMISSION_PRIORITY_RULES:
+        if path.startswith(prefix) and (methods is None or method in methods):
+            return priority
+    return PRIORITY_NORMAL
+
+class AdmissionController:
+    """Per-worker concurrency limit with a bounded priority wait queue.
+    
+    A finishing request hands its slot straight to the highest priority waiter. When the queue is
+    full a new request displaces the lowest priority waiter if it outranks it, otherwise it is rejected.
+    """
+    
+    def __init__(self, limit: int, queue_size: int, max_wait: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = []  # Heap of (priority, arrival, future)
+        self._arrivals = itertools.count()
+        self.rejections = {}  # (priority, reason) -> count
+        self.queue_wait_sum = 0.0
+        self.queued = 0
+    
+    def _reject(self, priority: int, reason: str) -> str:
+        key = (priority, reason)
+        self.rejections[key] = self.rejections.get(key, 0) + 1
+        return reason
+    
+    async def acquire(self, priority: int) -> Optional[str]:
+        """Wait for a slot; returns None once admitted or the reason the request was shed"""
+        if priority != PRIORITY_HIGH and event_loop_monitor.lag * 1000 > ADMISSION_MAX_LOOP_LAG_MS:
+            return self._reject(priority, "loop_lag")
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return None
+        
+        if len(self._waiters) >= self.queue_size:
+            # A waiter that timed out or was cancelled stays in the heap until its cleanup runs; drop those first
+            self._waiters = [waiter for waiter in self._waiters if not waiter[2].done()]
+            heapq.heapify(self._waiters)
+        if len(self._waiters) >= self.queue_size:
+            lowest = max(self._waiters)
+            if lowest[0] <= priority:
+                return self._reject(priority, "queue_full")
+            self._waiters.remove(lowest)
+            heapq.heapify(self._waiters)
+            if not lowest[2].done():
+                lowest[2].set_result(False)
+        
+        entry = (priority, next(self._arrivals), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        started = time.perf_counter()
+        try:
+            admitted = await asyncio.wait_for(entry[2], self.max_wait)
+        except asyncio.TimeoutError:
+            return self._reject(priority, "queue_timeout")
+        finally:
+            if not entry[2].done() or entry[2].cancelled():
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+            self.queued += 1
+            self.queue_wait_sum += time.perf_counter() - started
+        return None if admitted else self._reject(priority, "displaced")
+    
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)  # The slot passes to the waiter; active stays the same
+                return
+        self.active -= 1
+    
+    def render(self) -> str:
+        lines = [
+            "# HELP admission_active_requests Requests holding an admission slot",
+            "# TYPE admission_active_requests gauge",
+            f"admission_active_requests {self.active}",
+            "# HELP admission_queue_depth Requests waiting for an admission slot",
+            "# TYPE admission_queue_depth gauge",
+            f"admission_queue_depth {len(self._waiters)}",
+            "# HELP admission_queue_wait_seconds Time requests spent waiting for an admission slot",
+            "# TYPE admission_queue_wait_seconds summary",
+            f"admission_queue_wait_seconds_sum {self.queue_wait_sum}",
+            f"admission_queue_wait_seconds_count {self.queued}",
+            "# HELP admission_rejections_total Requests shed with a 503, by priority class and reason",
+            "# TYPE admission_rejections_total counter",
+        ]
+        for (priority, reason), count in sorted(self.rejections.items()):
+            lines.append(f"admission_rejections_total{prometheus_labels(priority=PRIORITY_NAMES[priority], reason=reason)} {count}")
+        return "\n".join(lines) + "\n"
+
+admission_controller = AdmissionController(ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_MAX_QUEUE_WAIT_MS / 1000)
+
+class AdmissionMiddleware:
+    """Admit /api requests through the admission controller; shed the rest with 503 and Retry-After"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or ADMISSION_MAX_CONCURRENCY <= 0 or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+        
+        reason = await admission_controller.acquire(request_priority(scope["method"], scope["path"]))
+        if reason is not None:
+            body = json.dumps({"detail": "Server is overloaded, please retry"}).encode()
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(ADMISSION_RETRY_AFTER_SECONDS).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_controller.release()
+
+# Request deadlines
+# Context from before the request's pymongo.timeout, for work that must not inherit its deadline
+request_base_context: ContextVar[Optional[contextvars.Context]] = ContextVar("request_base_context", default=None)
+
+def start_outside_deadline(fn, timeout: Optional[float]) -> asyncio.Future:
+    """Start fn() as a task outside the current request's pymongo.timeout, under a limit of its own.
+    
+    For work that outlives the request (streamed bodies) or is shared with other requests
+    (single-flight reads, loader batches). Other context, like DB attribution, carries over.
+    """
+    async def run():
+        with pymongo.timeout(timeout):
+            return await fn()
+    
+    base_context = request_base_context.get()
+    context = base_context.copy() if base_context is not None else contextvars.copy_context()
+    return context.run(asyncio.ensure_future, run())
+
+async def run_with_deadline(handler, scope, receive, send, deadline: float, metrics: RouteMetrics):
+    """Run an ASGI handler with a time limit.
+    
+    Every Mongo call inside gets the remaining time as maxTimeMS (pymongo.timeout; Motor carries the
+    context into its threads). The handler is cancelled when the deadline passes or the client
+    disconnects, so no further DB work is issued for an abandoned request. Overruns answer 504.
+    The deadline covers producing the response, not receiving or sending it: the request body is
+    read before the clock starts (slow uploads are not overruns), the timer stops at
+    http.response.start, and streamed bodies time each cursor batch on its own.
+    """
+    task = asyncio.current_task()
+    messages = asyncio.Queue()
+    aborted = None  # "deadline" or "disconnect"
+    response_started = response_complete = False
+    
+    def abort(reason: str):
+        nonlocal aborted
+        if aborted is None and not response_complete:
+            aborted = reason
+            task.cancel()
+    
+    async def watch_client():
+        # Sole reader of the ASGI receive channel, so a disconnect is seen even while the handler is busy
+        while True:
+            message = await receive()
+            messages.put_nowait(message)
+            if message["type"] == "http.disconnect":
+                abort("disconnect")
+                return
+    
+    async def send_tracked(message):
+        nonlocal response_started, response_complete
+        if message["type"] == "http.response.start":
+            response_started = True
+            timer.cancel()
+        elif message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_complete = True
+        await send(message)
+    
+    # Buffer the request body first; route handlers read it in full before doing any work anyway
+    while True:
+        message = await receive()
+        messages.put_nowait(message)
+        if message["type"] == "http.disconnect":
+            metrics.client_disconnects += 1
+            scope["client_disconnected"] = True
+            return
+        if not message.get("more_body", False):
+            break
+    
+    watcher = asyncio.create_task(watch_client())
+    timer = asyncio.get_running_loop().call_later(deadline, abort, "deadline")
+    request_base_context.set(contextvars.copy_context())
+    try:
+        with pymongo.timeout(deadline):
+            await handler(scope, messages.get, send_tracked)
+    except asyncio.CancelledError:
+        if aborted is None:
+            raise
+        if hasattr(task, "uncancel"):
+            task.uncancel()
+    except PyMongoError as exc:
+        if not exc.timeout:
+            raise
+        aborted = "deadline"
+    finally:
+        timer.cancel()
+        watcher.cancel()
+    
+    if aborted == "disconnect":
+        metrics.client_disconnects += 1
+        scope["client_disconnected"] = True
+    elif aborted == "deadline":
+        metrics.deadline_exceeded += 1
+        if not response_started:
+            body = json.dumps({"detail": "Request deadline exceeded"}).encode()
+            await send({"type": "http.response.start", "status": 504, "headers": [
+                (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())
+            ]})
+            await send({"type": "http.response.body", "body": body})
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    content = http_metrics.render() + event_loop_monitor.render() + admission_controller.render()
+    return Response(content=content, media_type=PROMETHEUS_CONTENT_TYPE)
+
+# Admin Routes
+async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.role != "Admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+@api_router.get("/admin/compression")
+async def get_compression_stats(admin: User = Depends(get_admin_user)):
+    """Compression ratio and CPU time per route since this worker started"""
+    return {"encodings": SUPPORTED_ENCODINGS, "routes": compression_stats.summary()}
+
+@api_router.get("/admin/single-flight")
+async def get_single_flight_stats(admin: User = Depends(get_admin_user)):
+    """How many reads ran against the database and how many joined an identical in-flight read"""
+    return single_flight.stats()
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(limit: int = 20, admin: User = Depends(get_admin_user)):
+    """Slow query shapes from the capped slow_queries log, ranked by total time"""
+    pipeline = [
+        {"$group": {
+            "_id": {"collection": "$collection", "command": "$command", "shape": "$shape"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "routes": {"$addToSet": "$route"},
+            "last_seen": {"$max": "$at"},
+            "explain": {"$max": "$explain"}
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": min(max(limit, 1), 100)}
+    ]
+    shapes = await db.slow_queries.aggregate(pipeline).to_list(100)
+    return {
+        "threshold_ms": SLOW_QUERY_THRESHOLD_MS,
+        "shapes": [
+            {
+                **shape.pop("_id"),
+                **shape,
+                "total_ms": round(shape["total_ms"], 3),
+                "avg_ms": round(shape["total_ms"] / shape["count"], 3),
+                "routes": sorted(shape["routes"])
+            }
+            for shape in shapes
+        ]
+    }
 
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware)
+
+app.add_middleware(AdmissionMiddleware)
+
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -830,6 +3443,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+background_tasks = []
+
+@app.on_event("startup")
+async def startup_tasks():
+    slow_query_log.attach(asyncio.get_running_loop())
+    
+    try:
+        await ensure_indexes()
+    except Exception:
+        logger.exception("Failed to create indexes")
+    
+    try:
+        await migrate_project_memberships()
+    except Exception:
+        logger.exception("Failed to reconcile project memberships")
+    
+    try:
+        await backfill_user_search_terms()
+        await backfill_comment_projects()
+        await backfill_task_title_lower()
+    except Exception:
+        logger.exception("Failed to backfill search fields")
+    
+    if NOTIFICATION_DIGEST_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(release_notification_digests()))
+    
+    if STATELESS_AUTH:
+        background_tasks.append(asyncio.create_task(token_revocations.run()))
+    
+    if EVENT_LOOP_MONITOR_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(event_loop_monitor.run()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
     client.close()
\ No newline at end of file
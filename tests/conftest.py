@@ -0,0 +1,12 @@
+import os
+import sys
+from pathlib import Path
+
+# The server module reads its settings at import time. Motor connects lazily, so only the route
+# tests (test_routes.py, skipped without a reachable server) ever open a database connection.
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+# N+1 queries and blown query budgets fail the request instead of only logging a warning
+os.environ.setdefault("QUERY_BUDGET_MODE", "raise")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,60 @@
+"""Project access: AccessResolver answers from the per-worker ProjectAccessCache"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+VIEW, MANAGE = server.PROJECT_VIEW, server.PROJECT_MANAGE
+
+
+class StubProjects:
+    """db.projects stand-in holding one project; counts find_one calls to show when the cache answered"""
+
+    def __init__(self, project):
+        self.project = project
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        return dict(self.project) if query["id"] == self.project["id"] else None
+
+
+@pytest.fixture
+def projects(monkeypatch):
+    projects = StubProjects({"id": "p1", "owner_id": "ann", "team_members": ["bob"]})
+    monkeypatch.setattr(server, "db", SimpleNamespace(projects=projects))
+    # Long enough that nothing here expires on its own
+    monkeypatch.setattr(server, "project_access_cache", server.ProjectAccessCache(ttl_seconds=3600, max_entries=100))
+    return projects
+
+
+def can(user_id, action, project_id="p1"):
+    return asyncio.run(server.AccessResolver(SimpleNamespace(id=user_id)).can(action, project_id))
+
+
+def test_membership_is_read_once_then_cached(projects):
+    assert can("bob", VIEW) and not can("bob", MANAGE) and can("ann", MANAGE)
+    assert not can("cy", VIEW)
+    assert projects.reads == 1
+
+
+def test_removing_a_member_revokes_access_at_once_after_invalidation(projects):
+    assert can("bob", VIEW)
+    projects.project["team_members"] = []
+    # Still served from the cache until the entry is dropped...
+    assert can("bob", VIEW)
+    server.project_access_cache.invalidate_project("p1")
+    # ...and refused on the very next check once it is, without waiting for the TTL
+    assert not can("bob", VIEW)
+
+
+def test_changing_the_owner_revokes_access_at_once_after_invalidation(projects):
+    assert can("ann", MANAGE) and not can("dee", MANAGE)
+    projects.project["owner_id"] = "dee"
+    server.project_access_cache.invalidate_project("p1")
+    assert not can("ann", MANAGE) and not can("ann", VIEW)
+    assert can("dee", MANAGE)
+    assert projects.reads == 2
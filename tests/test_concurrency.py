@@ -0,0 +1,351 @@
+"""In-process coordination: single-flight reads, the user loader, admission control and rate limit buckets"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# SingleFlight
+
+def test_single_flight_shares_one_call():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ["result"]
+
+    async def main():
+        flight = server.SingleFlight()
+        results = await asyncio.gather(*(flight.do(("tasks.list", "p1"), fetch) for _ in range(5)))
+        return flight, results
+
+    flight, results = run(main())
+    assert len(calls) == 1
+    assert all(result == ["result"] for result in results)
+    assert flight.stats() == {
+        "in_flight": 0, "queries": [{"query": "tasks.list", "executed": 1, "coalesced": 4}]
+    }
+
+
+def test_single_flight_keys_do_not_share():
+    async def main():
+        flight = server.SingleFlight()
+
+        async def fetch(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flight.do(("q", 1), lambda: fetch(1)), flight.do(("q", 2), lambda: fetch(2)))
+
+    assert run(main()) == [1, 2]
+
+
+def test_single_flight_survives_a_cancelled_caller():
+    async def main():
+        flight = server.SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.create_task(flight.do(("q",), fetch))
+        second = asyncio.create_task(flight.do(("q",), fetch))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert run(main()) == "done"
+
+
+def test_single_flight_propagates_errors_and_forgets_the_key():
+    async def main():
+        flight = server.SingleFlight()
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await flight.do(("q",), fail)
+        return flight.stats()["in_flight"]
+
+    assert run(main()) == 0
+
+
+def test_analytics_reads_after_a_write_do_not_join_an_earlier_computation(monkeypatch):
+    versions = {"tasks": 1, "projects": 1}
+    computed = []
+
+    async def probe_versions(*keys):
+        return {key: versions[key] for key in keys}
+
+    async def compute(user_id):
+        seen = dict(versions)
+        computed.append(seen)
+        await asyncio.sleep(0.02)
+        return seen
+
+    monkeypatch.setattr(server, "probe_versions", probe_versions)
+    monkeypatch.setattr(server, "compute_progress_analytics", compute)
+    monkeypatch.setattr(server, "single_flight", server.SingleFlight())
+    user = SimpleNamespace(id="u1")
+
+    async def main():
+        before = asyncio.create_task(server.get_progress_analytics(current_user=user))
+        joined = asyncio.create_task(server.get_progress_analytics(current_user=user))
+        await asyncio.sleep(0.005)
+        versions["tasks"] = 2  # A task write lands while the first computation runs
+        after = asyncio.create_task(server.get_progress_analytics(current_user=user))
+        return await asyncio.gather(before, joined, after)
+
+    before, joined, after = run(main())
+    assert before == joined == {"tasks": 1, "projects": 1}
+    assert after == {"tasks": 2, "projects": 1}
+    assert len(computed) == 2
+
+
+# UserLoader
+
+class StubUsers:
+    """db.users stand-in: find(...).to_list() answers after a short delay and records each query"""
+
+    def __init__(self, users, delay=0.01):
+        self.users = users
+        self.delay = delay
+        self.queries = []
+
+    def find(self, query, projection=None):
+        ids = query["id"]["$in"]
+        self.queries.append(sorted(ids))
+
+        async def to_list(length):
+            await asyncio.sleep(self.delay)
+            return [dict(self.users[user_id]) for user_id in ids if user_id in self.users]
+
+        return SimpleNamespace(to_list=to_list)
+
+
+@pytest.fixture
+def stub_users(monkeypatch):
+    users = StubUsers({
+        "u1": {"id": "u1", "name": "Ann", "email": "ann@example.com"},
+        "u2": {"id": "u2", "name": "Bob", "email": "bob@example.com"},
+    })
+    monkeypatch.setattr(server, "db", SimpleNamespace(users=users))
+    return users
+
+
+def test_user_loader_batches_one_tick_into_one_query(stub_users):
+    async def main():
+        loader = server.UserLoader(ttl_seconds=60, max_entries=100)
+        return await asyncio.gather(loader.load("u1"), loader.load("u2"), loader.load("u1"))
+
+    first, second, third = run(main())
+    assert (first["name"], second["name"], third["name"]) == ("Ann", "Bob", "Ann")
+    assert stub_users.queries == [["u1", "u2"]]
+
+
+def test_user_loader_caches_hits(stub_users):
+    async def main():
+        loader = server.UserLoader(ttl_seconds=60, max_entries=100)
+        await loader.load("u1")
+        await loader.load("u1")
+
+    run(main())
+    assert stub_users.queries == [["u1"]]
+
+
+def test_user_loader_does_not_cache_misses(stub_users):
+    async def main():
+        loader = server.UserLoader(ttl_seconds=60, max_entries=100)
+        before = await loader.load("u3")
+        stub_users.users["u3"] = {"id": "u3", "name": "Cy", "email": "cy@example.com"}
+        return before, await loader.load("u3")
+
+    before, after = run(main())
+    assert before is None
+    assert after["name"] == "Cy"
+
+
+def test_user_loader_cancelled_caller_does_not_fail_others(stub_users):
+    async def main():
+        loader = server.UserLoader(ttl_seconds=60, max_entries=100)
+        cancelled = asyncio.create_task(loader.load("u1"))
+        other = asyncio.create_task(loader.load("u1"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return await other
+
+    assert run(main())["name"] == "Ann"
+
+
+def test_user_loader_invalidate_reloads(stub_users):
+    async def main():
+        loader = server.UserLoader(ttl_seconds=60, max_entries=100)
+        await loader.load("u1")
+        stub_users.users["u1"] = {"id": "u1", "name": "Ann B", "email": "ann@example.com"}
+        loader.invalidate("u1")
+        return await loader.load("u1")
+
+    assert run(main())["name"] == "Ann B"
+
+
+# AdmissionController
+
+HIGH, NORMAL, LOW = server.PRIORITY_HIGH, server.PRIORITY_NORMAL, server.PRIORITY_LOW
+
+
+def test_admission_admits_up_to_the_limit_then_queues():
+    async def main():
+        controller = server.AdmissionController(limit=1, queue_size=2, max_wait=1)
+        assert await controller.acquire(NORMAL) is None
+        waiter = asyncio.create_task(controller.acquire(NORMAL))
+        await asyncio.sleep(0)
+        assert not waiter.done() and controller.active == 1
+        controller.release()
+        assert await waiter is None
+        assert controller.active == 1
+        controller.release()
+        assert controller.active == 0
+
+    run(main())
+
+
+def test_admission_hands_the_slot_to_the_highest_priority_waiter():
+    async def main():
+        controller = server.AdmissionController(limit=1, queue_size=3, max_wait=1)
+        await controller.acquire(NORMAL)
+        order = []
+
+        async def wait(priority, name):
+            await controller.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.create_task(wait(LOW, "low")), asyncio.create_task(wait(HIGH, "high"))]
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(main()) == ["high", "low"]
+
+
+def test_admission_full_queue_displaces_a_lower_priority_waiter():
+    async def main():
+        controller = server.AdmissionController(limit=1, queue_size=1, max_wait=1)
+        await controller.acquire(NORMAL)
+        low = asyncio.create_task(controller.acquire(LOW))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(controller.acquire(HIGH))
+        assert await low == "displaced"
+        assert await controller.acquire(LOW) == "queue_full"
+        controller.release()
+        assert await high is None
+        return controller.rejections
+
+    assert run(main()) == {(LOW, "displaced"): 1, (LOW, "queue_full"): 1}
+
+
+def test_admission_times_out_queued_requests():
+    async def main():
+        controller = server.AdmissionController(limit=1, queue_size=1, max_wait=0.01)
+        await controller.acquire(NORMAL)
+        assert await controller.acquire(NORMAL) == "queue_timeout"
+        return len(controller._waiters)
+
+    assert run(main()) == 0
+
+
+def test_admission_skips_a_waiter_whose_wait_already_ended():
+    # A timed-out waiter stays in the heap until its cleanup runs; displacing it used to raise InvalidStateError
+    async def main():
+        controller = server.AdmissionController(limit=1, queue_size=1, max_wait=1)
+        await controller.acquire(NORMAL)
+        expired = asyncio.get_running_loop().create_future()
+        expired.cancel()
+        controller._waiters.append((LOW, -1, expired))
+        high = asyncio.create_task(controller.acquire(HIGH))
+        await asyncio.sleep(0)
+        controller.release()
+        return await high, controller.active
+
+    assert run(main()) == (None, 1)
+
+
+def test_admission_sheds_normal_traffic_when_the_loop_lags(monkeypatch):
+    monkeypatch.setattr(server.event_loop_monitor, "lag", server.ADMISSION_MAX_LOOP_LAG_MS / 1000 + 1)
+
+    async def main():
+        controller = server.AdmissionController(limit=10, queue_size=10, max_wait=1)
+        return await controller.acquire(NORMAL), await controller.acquire(HIGH)
+
+    assert run(main()) == ("loop_lag", None)
+
+
+# TokenBucketStore
+
+def test_token_bucket_allows_capacity_then_rejects():
+    async def main():
+        store = server.TokenBucketStore(max_keys=10)
+        return [await store.hit("auth:1.2.3.4", 3, 60) for _ in range(4)]
+
+    results = run(main())
+    assert [allowed for allowed, *_ in results] == [True, True, True, False]
+    assert [remaining for _, remaining, *_ in results] == [2, 1, 0, 0]
+    assert results[-1][3] == pytest.approx(20, rel=0.01)  # One token refills every 60 / 3 seconds
+
+
+def test_token_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+
+    async def main():
+        store = server.TokenBucketStore(max_keys=10)
+        await store.hit("k", 1, 10)
+        rejected = await store.hit("k", 1, 10)
+        now[0] += 10
+        return rejected[0], (await store.hit("k", 1, 10))[0]
+
+    assert run(main()) == (False, True)
+
+
+def test_token_bucket_store_is_bounded_and_evicts_least_recently_used():
+    async def main():
+        store = server.TokenBucketStore(max_keys=3)
+        for key in ("a", "b", "c"):
+            await store.hit(key, 5, 60)
+        await store.hit("a", 5, 60)  # "b" is now the least recently used
+        await store.hit("d", 5, 60)
+        return list(store.limits[(5, 60)])
+
+    assert run(main()) == ["c", "a", "d"]
+
+
+def test_token_bucket_eviction_keeps_other_limits_buckets(monkeypatch):
+    # Pruning once used the period of whichever limit was being hit, dropping other limits' unrefilled buckets
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+
+    async def main():
+        store = server.TokenBucketStore(max_keys=2)
+        await store.hit("writes:u1", 100, 1)
+        await store.hit("auth:ip", 1, 3600)
+        now[0] += 2  # Long enough to refill a writes bucket, nowhere near an auth one
+        await store.hit("writes:u1", 100, 1)
+        await store.hit("writes:u2", 100, 1)
+        return (await store.hit("auth:ip", 1, 3600))[0]
+
+    assert run(main()) is False
@@ -0,0 +1,132 @@
+"""Request deadlines (run_with_deadline via NegotiatedRoute)"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from pymongo import _csot
+from starlette.responses import StreamingResponse
+
+import server
+
+DEADLINE = 0.2
+
+router = APIRouter(route_class=server.NegotiatedRoute)
+
+
+@router.get("/slow")
+async def slow():
+    await asyncio.sleep(DEADLINE * 3)
+    return {"ok": True}
+
+
+@router.post("/echo")
+async def echo(payload: dict):
+    return {"remaining": _csot.remaining(), **payload}
+
+
+@router.get("/stream")
+async def stream():
+    async def chunks():
+        for _ in range(3):
+            await asyncio.sleep(DEADLINE)
+            yield b"x"
+
+    return StreamingResponse(chunks())
+
+
+@router.get("/shared")
+async def shared():
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return _csot.remaining()
+
+    # A fresh key per call: the point is where the shared work runs, not coalescing
+    return {"remaining": await server.single_flight.do(("test.shared", id(fetch)), fetch)}
+
+
+@router.get("/loader")
+async def loader():
+    return await server.UserLoader(ttl_seconds=60, max_entries=10).load("u1")
+
+
+app = FastAPI()
+app.include_router(router)
+
+
+@pytest.fixture(autouse=True)
+def short_deadlines(monkeypatch):
+    monkeypatch.setattr(server, "REQUEST_DEADLINE_SECONDS", DEADLINE)
+    monkeypatch.setattr(server, "REQUEST_DEADLINE_OVERRIDES", {})
+
+
+def call(method, path, body_chunks=(b"",), chunk_delay=0.0):
+    """Drive the app directly over ASGI, optionally trickling the request body in"""
+    sent = []
+    pending = list(body_chunks)
+
+    async def receive():
+        if pending:
+            await asyncio.sleep(chunk_delay)
+            chunk = pending.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    headers = [(b"content-type", b"application/json")] if method == "POST" else []
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+    status = next(message["status"] for message in sent if message["type"] == "http.response.start")
+    body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    return status, body
+
+
+def test_overrun_answers_504():
+    status, body = call("GET", "/slow")
+    assert status == 504
+    assert json.loads(body) == {"detail": "Request deadline exceeded"}
+
+
+def test_slow_upload_does_not_count_against_the_deadline():
+    chunks = [b'{"name": ', b'"report.pdf"', b"}"]
+    status, body = call("POST", "/echo", chunks, chunk_delay=DEADLINE)
+    assert status == 200
+    payload = json.loads(body)
+    assert payload["name"] == "report.pdf"
+    assert 0 < payload["remaining"] <= DEADLINE
+
+
+def test_stream_outliving_the_deadline_is_sent_in_full():
+    assert call("GET", "/stream") == (200, b"xxx")
+
+
+def test_shared_work_runs_under_its_own_time_limit(monkeypatch):
+    monkeypatch.setattr(server, "SHARED_READ_TIMEOUT_SECONDS", 30.0)
+    status, body = call("GET", "/shared")
+    assert status == 200
+    # Later callers wait on the same result, so it is not bounded by the first caller's deadline
+    assert DEADLINE < json.loads(body)["remaining"] <= 30
+
+
+def test_loader_batches_run_under_their_own_time_limit(monkeypatch):
+    monkeypatch.setattr(server, "SHARED_READ_TIMEOUT_SECONDS", 30.0)
+
+    def find(query, projection=None):
+        async def to_list(length):
+            return [{"id": "u1", "remaining": _csot.remaining()}]
+
+        return SimpleNamespace(to_list=to_list)
+
+    monkeypatch.setattr(server, "db", SimpleNamespace(users=SimpleNamespace(find=find)))
+    status, body = call("GET", "/loader")
+    assert status == 200
+    assert DEADLINE < json.loads(body)["remaining"] <= 30
@@ -0,0 +1,88 @@
+"""Query budget enforcement (QUERY_BUDGET_MODE=raise, set in conftest)"""
+
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import server
+
+listener = server.DbCommandListener()
+
+
+def fake_command(request_id, command_name, collection, command):
+    """Report one command to the listener, as pymongo would for a real round trip"""
+    started = SimpleNamespace(
+        connection_id=("db", 27017), request_id=request_id, database_name="test_database",
+        command_name=command_name, command={command_name: collection, **command}
+    )
+    listener.started(started)
+    listener.succeeded(SimpleNamespace(
+        connection_id=started.connection_id, request_id=request_id, command_name=command_name,
+        duration_micros=100, reply={"cursor": {"firstBatch": []}}
+    ))
+
+
+def make_client():
+    app = FastAPI()
+
+    @app.get("/n-plus-one")
+    async def n_plus_one():
+        # The N+1 signature: one lookup per item, differing only in the id
+        for i in range(server.QUERY_REPEAT_LIMIT + 1):
+            fake_command(i, "find", "users", {"filter": {"id": f"user-{i}"}})
+        return {"ok": True}
+
+    @app.get("/batched")
+    async def batched():
+        fake_command(0, "find", "tasks", {"filter": {"project_id": "p"}})
+        fake_command(1, "find", "users", {"filter": {"id": {"$in": ["a", "b", "c"]}}})
+        return {"ok": True}
+
+    @app.get("/chatty")
+    async def chatty():
+        for i in range(server.QUERY_BUDGET_DEFAULT + 1):
+            fake_command(i, "find", f"collection_{i}", {"filter": {}})
+        return {"ok": True}
+
+    return TestClient(server.MetricsMiddleware(app))
+
+
+def test_raise_mode_is_on_for_tests():
+    assert server.QUERY_BUDGET_MODE == "raise"
+
+
+def test_repeated_query_shape_fails_the_request():
+    response = make_client().get("/n-plus-one")
+    assert response.status_code == 500
+    detail = response.json()["detail"]
+    assert "Query budget exceeded" in detail
+    assert f"{server.QUERY_REPEAT_LIMIT + 1}x find users" in detail
+
+
+def test_batched_queries_pass():
+    response = make_client().get("/batched")
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert 'desc="2 queries"' in response.headers["server-timing"]
+
+
+def test_too_many_calls_fail_the_request():
+    response = make_client().get("/chatty")
+    assert response.status_code == 500
+    assert f"budget is {server.QUERY_BUDGET_DEFAULT}" in response.json()["detail"]
+
+
+def test_violations_name_the_repeated_shape():
+    stats = server.RequestDbStats()
+    stats.commands = [("users", "find", 0.0, 1)] * 7
+    stats.shapes = ['find users {"filter": {"id": "?"}}'] * 7
+    assert server.query_budget_violations("GET", "/x", stats) == ['7x find users {"filter": {"id": "?"}}']
+
+
+def test_overrides_raise_the_budget(monkeypatch):
+    monkeypatch.setattr(server, "QUERY_BUDGET_OVERRIDES", {"POST /api/tasks/bulk": 100})
+    stats = server.RequestDbStats()
+    stats.commands = [("tasks", "insert", 0.0, 1)] * 50
+    assert server.query_budget_violations("POST", "/api/tasks/bulk", stats) == []
+    assert server.query_budget_violations("POST", "/api/tasks", stats) == [f"50 db calls, budget is {server.QUERY_BUDGET_DEFAULT}"]
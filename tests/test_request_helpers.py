@@ -0,0 +1,100 @@
+"""Pure request helpers: conditional writes and task list filters"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+# parse_if_match / version_filter
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("*", None),
+    (" * ", None),
+    ('"3"', 3),
+    ('W/"3"', 3),
+    ("7", 7),
+    (' "0" ', 0),
+])
+def test_parse_if_match(header, expected):
+    assert server.parse_if_match(header) == expected
+
+
+@pytest.mark.parametrize("header", ['"abc"', "W/", '"1.5"'])
+def test_parse_if_match_rejects_non_versions(header):
+    with pytest.raises(HTTPException) as error:
+        server.parse_if_match(header)
+    assert error.value.status_code == 400
+
+
+def test_version_filter():
+    assert server.version_filter(None) == {}
+    assert server.version_filter(4) == {"version": 4}
+    # Version 0 also matches documents written before versioning
+    assert server.version_filter(0) == {"version": {"$in": [0, None]}}
+
+
+def test_set_version_etag_round_trips_through_parse_if_match():
+    response = server.Response()
+    server.set_version_etag(response, {"version": 5})
+    assert server.parse_if_match(response.headers["ETag"]) == 5
+
+
+# task_filters / task_sort
+
+def filters(**kwargs):
+    arguments = dict(status=None, assigned_to=None, created_by=None, due_after=None, due_before=None, q=None)
+    arguments.update(kwargs)
+    return server.task_filters(**arguments)
+
+
+def test_task_filters_empty():
+    assert filters() == {}
+
+
+def test_task_filters_status():
+    assert filters(status=["Done"]) == {"status": "Done"}
+    assert filters(status=["To Do", "Done"]) == {"status": {"$in": ["To Do", "Done"]}}
+
+
+def test_task_filters_people():
+    assert filters(assigned_to="u1", created_by="u2") == {"assigned_to": "u1", "created_by": "u2"}
+
+
+def test_task_filters_due_range_is_naive_utc():
+    after = datetime(2026, 1, 1, 2, 0, tzinfo=timezone(timedelta(hours=2)))
+    before = datetime(2026, 2, 1)
+    assert filters(due_after=after, due_before=before) == {
+        "due_date": {"$gte": datetime(2026, 1, 1, 0, 0), "$lte": datetime(2026, 2, 1)}
+    }
+    assert filters(due_before=before) == {"due_date": {"$lte": before}}
+
+
+def test_task_filters_title_prefix_is_normalized_and_escaped():
+    assert filters(q="  Déploy.* ") == {"title_lower": {"$regex": "^deploy\\.\\*"}}
+    assert filters(q="   ") == {}
+
+
+def test_task_sort():
+    assert server.task_sort(None) is None
+    assert server.task_sort("due_date") == [("due_date", 1)]
+    assert server.task_sort("-created_at") == [("created_at", -1)]
+    # Titles sort on the normalized copy so case does not split the order
+    assert server.task_sort("title") == [("title_lower", 1)]
+
+
+@pytest.mark.parametrize("sort", ["priority", "-", "password"])
+def test_task_sort_rejects_unknown_keys(sort):
+    with pytest.raises(HTTPException) as error:
+        server.task_sort(sort)
+    assert error.value.status_code == 400
+
+
+def test_task_document_adds_the_normalized_title():
+    task = server.Task(title="Ünïcode Title", project_id="p1", created_by="u1")
+    document = server.task_document(task)
+    assert document["title_lower"] == "unicode title"
+    assert document["title"] == "Ünïcode Title"
@@ -0,0 +1,226 @@
+"""Real routes against a real mongod, with the query budget in raise mode.
+
+The budget only sees commands that reach the server, and auth state lives in the database, so these
+need a MongoDB at TEST_MONGO_URL (default: MONGO_URL). They are skipped when none is reachable.
+Each test uses a throwaway database.
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pymongo
+import pytest
+from fastapi.testclient import TestClient
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL", os.environ["MONGO_URL"])
+
+# More distinct ids than the repeated-shape guard allows, so a per-item lookup fails the request
+FANOUT = server.QUERY_REPEAT_LIMIT + 2
+
+
+@pytest.fixture
+def mongo():
+    """Synchronous handle on a throwaway database, for setup and checks outside the app; skips without a server"""
+    client = pymongo.MongoClient(TEST_MONGO_URL, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        client.close()
+        pytest.skip(f"no MongoDB at {TEST_MONGO_URL}")
+    db = client[f"test_routes_{uuid.uuid4().hex[:12]}"]
+    try:
+        yield db
+    finally:
+        client.drop_database(db.name)
+        client.close()
+
+
+@pytest.fixture
+def api(monkeypatch, mongo):
+    # Reports to the query budget listener like the server's own client
+    client = AsyncIOMotorClient(TEST_MONGO_URL, event_listeners=[server.DbCommandListener()])
+    monkeypatch.setattr(server, "client", client)
+    monkeypatch.setattr(server, "db", client[mongo.name])
+    monkeypatch.setattr(server, "QUERY_BUDGET_MODE", "raise")
+    monkeypatch.setattr(server, "DB_COMMAND_INSTRUMENTATION", True)
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", False)
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+def register(api, name):
+    response = api.post("/api/auth/register", json={
+        "name": name, "email": f"{name.lower()}-{uuid.uuid4().hex[:8]}@example.com",
+        "password": "secret", "role": "Manager",
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return bearer(body), body["user"]
+
+
+def bearer(tokens):
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+def ok(response):
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def board(api):
+    """An owner with FANOUT projects, each shared with every member and holding tasks assigned across them"""
+    owner_headers, owner = register(api, "Owner")
+    members = [register(api, f"Member{i}") for i in range(FANOUT)]
+    member_ids = [member["id"] for _, member in members]
+    projects = []
+    for i in range(FANOUT):
+        project = ok(api.post("/api/projects", json={"title": f"Launch {i}"}, headers=owner_headers))
+        ok(api.patch(f"/api/projects/{project['id']}/team", json={"add": member_ids}, headers=owner_headers))
+        projects.append(project)
+    for i, member_id in enumerate(member_ids):
+        ok(api.post("/api/tasks", json={
+            "title": f"Write launch notes {i}", "description": "launch checklist",
+            "project_id": projects[0]["id"], "assigned_to": member_id,
+        }, headers=owner_headers))
+    return owner_headers, members, projects
+
+
+def test_task_lists_with_users_stay_within_budget(api, board):
+    owner_headers, members, projects = board
+    tasks = ok(api.get("/api/tasks", params={"project_id": projects[0]["id"], "include_users": "true"},
+                       headers=owner_headers))
+    assert len(tasks) == FANOUT
+    assert {task["assignee"]["id"] for task in tasks} == {member["id"] for _, member in members}
+    assert len(ok(api.get("/api/tasks", params={"include_users": "true"}, headers=members[0][0]))) == FANOUT
+
+
+def test_bulk_across_many_projects_stays_within_budget(api, board):
+    owner_headers, _, projects = board
+    operations = [{"op": "create", "task": {"title": f"Bulk {i}", "project_id": project["id"]}}
+                  for i, project in enumerate(projects)]
+    result = ok(api.post("/api/tasks/bulk", json={"operations": operations}, headers=owner_headers))
+    assert (result["succeeded"], result["failed"]) == (FANOUT, 0)
+    created = [row["task_id"] for row in result["results"]]
+    moves = [{"op": "update_status", "task_id": task_id, "status": "Done"} for task_id in created]
+    assert ok(api.post("/api/tasks/bulk", json={"operations": moves}, headers=owner_headers))["succeeded"] == FANOUT
+
+
+def test_search_stays_within_budget(api, board):
+    owner_headers, _, projects = board
+    task_id = ok(api.get("/api/tasks", params={"project_id": projects[0]["id"]}, headers=owner_headers))[0]["id"]
+    for i in range(FANOUT):
+        ok(api.post("/api/comments", json={"task_id": task_id, "content": f"launch update {i}"},
+                    headers=owner_headers))
+    results = ok(api.get("/api/search", params={"q": "launch"}, headers=owner_headers))["results"]
+    assert len(results) >= FANOUT
+
+
+def test_analytics_stay_within_budget(api, board):
+    owner_headers, _, projects = board
+    progress = ok(api.get("/api/analytics/progress", headers=owner_headers))
+    assert {row["project_id"] for row in progress} == {project["id"] for project in projects}
+    assert ok(api.get("/api/analytics/overview", headers=owner_headers))
+
+
+# Refresh token rotation
+
+def refresh(api, refresh_token):
+    return api.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+
+
+def login_tokens(api, email):
+    return ok(api.post("/api/auth/login", json={"email": email, "password": "secret"}))
+
+
+def test_refresh_returns_a_new_pair(api):
+    _, user = register(api, "Ann")
+    first = login_tokens(api, user["email"])
+    second = ok(refresh(api, first["refresh_token"]))
+    assert second["refresh_token"] != first["refresh_token"]
+    assert ok(api.get("/api/auth/me", headers=bearer(second)))["id"] == user["id"]
+    # The rotated token is good for exactly one more refresh
+    assert ok(refresh(api, second["refresh_token"]))["user"]["id"] == user["id"]
+
+
+def test_reusing_a_rotated_refresh_token_revokes_its_family(api):
+    _, user = register(api, "Ann")
+    stolen = login_tokens(api, user["email"])
+    other_session = login_tokens(api, user["email"])
+    current = ok(refresh(api, stolen["refresh_token"]))
+    
+    assert refresh(api, stolen["refresh_token"]).status_code == 401
+    # The legitimate holder's newer token was in the same family, so it is gone too
+    assert refresh(api, current["refresh_token"]).status_code == 401
+    # Access tokens issued so far are revoked as well
+    assert api.get("/api/auth/me", headers=bearer(current)).status_code == 401
+    # A separate login is a separate family and keeps working
+    assert ok(refresh(api, other_session["refresh_token"]))["user"]["id"] == user["id"]
+
+
+def test_expired_refresh_token_is_a_plain_401(api, mongo):
+    _, user = register(api, "Ann")
+    expired = login_tokens(api, user["email"])
+    sibling = ok(refresh(api, login_tokens(api, user["email"])["refresh_token"]))
+    # Expired but not yet removed, as between runs of the TTL monitor
+    mongo.refresh_tokens.update_one({"_id": server.hash_refresh_token(expired["refresh_token"])},
+                                    {"$set": {"expires_at": datetime.utcnow() - timedelta(minutes=1)}})
+    
+    response = refresh(api, expired["refresh_token"])
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Invalid or expired refresh token"}
+    # Nothing was revoked: the user's other tokens still work
+    assert ok(api.get("/api/auth/me", headers=bearer(sibling)))["id"] == user["id"]
+    assert ok(refresh(api, sibling["refresh_token"]))["user"]["id"] == user["id"]
+
+
+# Stateless access tokens
+
+@pytest.fixture
+def stateless(monkeypatch):
+    monkeypatch.setattr(server, "STATELESS_AUTH", True)
+    monkeypatch.setattr(server, "token_revocations", server.TokenRevocationList())
+
+
+def test_revoked_stateless_token_is_rejected_on_the_next_request(api, stateless):
+    headers, user = register(api, "Ann")
+    assert ok(api.get("/api/auth/me", headers=headers))["id"] == user["id"]
+    ok(api.post("/api/auth/logout", headers=headers))
+    assert api.get("/api/auth/me", headers=headers).status_code == 401
+
+
+def test_other_workers_reject_a_revoked_stateless_token_after_their_next_refresh(api, stateless, monkeypatch):
+    headers, _ = register(api, "Ann")
+    ok(api.post("/api/auth/logout", headers=headers))
+    # A worker that has not seen the logout learns of it from the token_revocations collection
+    other_worker = server.TokenRevocationList()
+    api.portal.call(other_worker.refresh)
+    monkeypatch.setattr(server, "token_revocations", other_worker)
+    assert api.get("/api/auth/me", headers=headers).status_code == 401
+
+
+# Project access cache
+
+def test_team_changes_revoke_access_on_the_next_request(api):
+    owner_headers, _ = register(api, "Owner")
+    member_headers, member = register(api, "Member")
+    project = ok(api.post("/api/projects", json={"title": "Launch"}, headers=owner_headers))
+    team = f"/api/projects/{project['id']}/team"
+
+    def member_sees_board():
+        response = api.get("/api/tasks", params={"project_id": project["id"]}, headers=member_headers)
+        return response.status_code == 200
+
+    ok(api.patch(team, json={"add": [member["id"]]}, headers=owner_headers))
+    assert member_sees_board()  # Membership is now cached on this worker
+    ok(api.patch(team, json={"remove": [member["id"]]}, headers=owner_headers))
+    assert not member_sees_board()
+
+    ok(api.put(team, json={"team_members": [member["id"]]}, headers=owner_headers))
+    assert member_sees_board()
+    ok(api.put(team, json={"team_members": []}, headers=owner_headers))
+    assert not member_sees_board()
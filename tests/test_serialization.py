@@ -0,0 +1,132 @@
+"""Response encoding: list serializers and compression negotiation"""
+
+import json
+import zlib
+from datetime import datetime
+
+import pytest
+
+import server
+
+TASKS = [
+    {
+        "_id": "ignored-object-id",
+        "id": "t1",
+        "title": "Write docs",
+        "description": "Explain the deploy",
+        "project_id": "p1",
+        "assigned_to": "u2",
+        "due_date": datetime(2026, 1, 5, 9, 30),
+        "status": "In Progress",
+        "created_by": "u1",
+        "created_at": datetime(2025, 12, 1, 8, 0, 0, 123456),
+        "version": 3,
+        "title_lower": "write docs",
+    },
+    {
+        # Written before versioning and without optional fields
+        "id": "t2",
+        "title": "Deploy",
+        "project_id": "p1",
+        "status": "To Do",
+        "created_by": "u1",
+        "created_at": datetime(2025, 12, 2),
+    },
+]
+
+
+@pytest.fixture(params=[True, False], ids=["trusted", "validated"])
+def trusted(request, monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_OUTPUT_SERIALIZATION", request.param)
+    return request.param
+
+
+def validated_json(documents):
+    """What pydantic itself produces for the documents, the reference for both modes"""
+    adapter = server.task_list_serializer.adapter
+    return json.loads(adapter.dump_json(adapter.validate_python(documents)))
+
+
+def test_dump_json_matches_the_validated_output(trusted):
+    rows = json.loads(server.task_list_serializer.dump_json(TASKS))
+    assert rows == validated_json(TASKS)
+    assert [sorted(row) for row in rows] == [sorted(server.Task.model_fields)] * 2
+    assert rows[1]["description"] == "" and rows[1]["assigned_to"] is None and rows[1]["version"] == 0
+    assert rows[0]["created_at"] == "2025-12-01T08:00:00.123456"
+
+
+def test_stream_items_join_into_the_same_array(trusted):
+    items = b",".join(server.task_list_serializer.dump_json_items([task], ndjson=False) for task in TASKS)
+    assert json.loads(b"[" + items + b"]") == validated_json(TASKS)
+
+
+def test_ndjson_items_are_one_document_per_line(trusted):
+    lines = server.task_list_serializer.dump_json_items(TASKS, ndjson=True).split(b"\n")
+    assert lines[-1] == b""
+    assert [json.loads(line) for line in lines[:-1]] == validated_json(TASKS)
+
+
+@pytest.mark.skipif(server.msgpack is None, reason="msgpack not installed")
+def test_msgpack_carries_the_same_rows(trusted):
+    rows = server.msgpack.unpackb(server.task_list_serializer.dump_msgpack(TASKS), timestamp=3)
+    assert [row["id"] for row in rows] == ["t1", "t2"]
+    assert rows[0]["due_date"].replace(tzinfo=None) == datetime(2026, 1, 5, 9, 30)
+
+
+@pytest.mark.skipif(server.msgpack is None, reason="msgpack not installed")
+def test_msgpack_passes_string_dates_through(trusted):
+    # Documents written as ISO strings are only coerced in validated mode
+    task = dict(TASKS[1], created_at="2025-12-02T00:00:00")
+    rows = server.msgpack.unpackb(server.task_list_serializer.dump_msgpack([task]), timestamp=3)
+    created_at = rows[0]["created_at"]
+    if trusted:
+        assert created_at == "2025-12-02T00:00:00"
+    else:
+        assert created_at.replace(tzinfo=None) == datetime(2025, 12, 2)
+
+
+# Compression negotiation
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip", "gzip"),
+    ("gzip, deflate", "gzip"),
+    ("GZIP;q=0.5", "gzip"),
+    ("identity", None),
+    ("gzip;q=0", None),
+    ("gzip;q=bogus", None),
+    ("", None),
+])
+def test_choose_encoding(accept_encoding, expected):
+    assert server.choose_encoding(accept_encoding) == expected
+
+
+def test_choose_encoding_prefers_the_server_order_on_ties():
+    assert server.choose_encoding("gzip, br, zstd") == server.SUPPORTED_ENCODINGS[0]
+    assert server.choose_encoding("*") == server.SUPPORTED_ENCODINGS[0]
+
+
+def test_choose_encoding_honours_client_weights():
+    assert server.choose_encoding("br;q=0.1, gzip;q=0.9") == "gzip"
+
+
+def decompressor(encoding):
+    """Incremental decoder: feed it compressed bytes, get back everything decodable so far"""
+    if encoding == "gzip":
+        return zlib.decompressobj(31).decompress
+    if encoding == "br":
+        return server.brotli.Decompressor().process
+    return server.zstandard.ZstdDecompressor().decompressobj().decompress
+
+
+@pytest.mark.parametrize("encoding", server.SUPPORTED_ENCODINGS)
+def test_stream_compressor_round_trips_chunked_output(encoding):
+    chunks = [b"[", b'{"id": "t1"},' * 200, b'{"id": "t2"}', b"]"]
+    compressor = server.StreamCompressor(encoding)
+    decode = decompressor(encoding)
+    decoded = b""
+    for chunk in chunks[:-1]:
+        decoded += decode(compressor.compress(chunk, final=False))
+        # Non-final chunks are flushed, so the client can decode everything sent so far
+        assert decoded == b"".join(chunks)[:len(decoded)] and decoded.endswith(chunk)
+    decoded += decode(compressor.compress(chunks[-1], final=True))
+    assert decoded == b"".join(chunks)